@@ -1,30 +1,97 @@
 import datetime
 # for de-serializing etc (writing object to file)
 import pickle
+from collections import namedtuple
 
-from yfinance import Ticker
-
+import metrics
 from Stock import Stock
-import yfinance as yf
+from ledger import TradeLedger
+from portfolio import Portfolio
+from profile_store import SQLITE_SUFFIXES, ProfileStore
+from journal import JOURNAL_SUFFIX, load_journaled_trader, store_journaled_trader
+from quotes import FETCH_TIMEOUT, MAX_WORKERS, PriceProvider, default_price_provider
+
+# net_worth = balance + sum(positions.values()); `missing` lists held symbols that couldn't be priced
+Valuation = namedtuple('Valuation', ['net_worth', 'balance', 'positions', 'prices', 'missing'])
+
+# side is 'buy' or 'sell'; give either amount (shares) or value (money), like buy_shares/buy and sell(amount=/value=)
+Order = namedtuple('Order', ['side', 'stock_name', 'amount', 'value'], defaults=(None, None))
 
 
 class Trader:
-    def __init__(self, username, fee: float = 0, initial_balance: float = 0):
+    def __init__(self, username, fee: float = 0, initial_balance: float = 0, price_provider: PriceProvider = None,
+                 cost_basis: str = 'fifo', clock=None):
         self.username=username
-        self.trades = []
+        self.trades = TradeLedger()
+        # cost basis, realized P&L and fees, kept up to date on every fill
+        self.portfolio = Portfolio(cost_basis)
         self.owned = dict()
         self.fee = fee
         self.balance = initial_balance
+        self.price_provider = price_provider if price_provider is not None else default_price_provider()
+        # set when the trader is backed by a journal file (see journal.py)
+        self.journal = None
+        # (database path, trades stored there) after a ProfileStore load or save, see profile_store.py
+        self.stored_in = None
+        # what trades get stamped with; backtests swap in a simulated clock
+        self.clock = clock if clock is not None else datetime.datetime.now
+
+    def __getstate__(self):
+        # the price provider (and its cache), the open journal and the clock are runtime state,
+        # don't write them into profiles
+        state = self.__dict__.copy()
+        state.pop('price_provider', None)
+        state.pop('journal', None)
+        state.pop('stored_in', None)
+        state.pop('clock', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if isinstance(self.trades, list):
+            # profiles from before the ledger stored a plain list of Stock objects
+            self.trades = TradeLedger(self.trades)
+        if 'portfolio' not in state:
+            self.portfolio = Portfolio.from_ledger(self.trades)
+        self.price_provider = default_price_provider()
+        self.journal = None
+        self.stored_in = None
+        self.clock = datetime.datetime.now
+
+    def get_share_price(self, stock_name: str) -> float:
+        # raises KeyError for unknown symbols
+        with metrics.span('trader.price_fetch'):
+            return self.price_provider.get_price(stock_name)
 
     def set_fee(self, fee: float):
         assert 1 >= fee >= 0 # fee is a fractional percentage
         self.fee = fee
+        self._record('fee', value=fee)
 
     def add_money(self, money: float):
         self.balance += money
+        self._record('cash', value=money)
 
     def remove_money(self, money: float):
         self.balance -= money
+        self._record('cash', value=-money)
+
+    def _fill(self, stock_name, amount, share_price, fee):
+        # single place where a trade hits the books: amount is signed (negative for sells)
+        trade = Stock(stock_name, amount, share_price, self.clock())
+        # add current trade to my stocks dickt
+        curr = self.owned.setdefault(stock_name, 0)
+        self.owned[stock_name] = curr + amount
+        # pay for a buy / collect for a sell, then subtract the trade fee
+        self.balance -= amount * share_price + fee
+        self.trades.append(trade, fee)
+        self.portfolio.apply(stock_name, amount, share_price, fee)
+        self._record('trade', trade=trade, fee=fee)
+        return trade
+
+    def _record(self, kind, **fields):
+        if self.journal is not None:
+            self.journal.append(kind, **fields)
 
     def buy(self, stock_name: str, cost: float):  # still gotta find out if one can buy half a stock lol
         assert cost <= self.balance, f"Can't buy more than you got. " \
@@ -32,114 +99,136 @@ class Trader:
         # check if stock name exists
         try:
             # if it is, get share price
-            share_price = float(yf.Ticker(stock_name).get_info()['currentPrice'])
-            # check how much the money I spent can get me
-            current_purchase_total = cost / share_price
-            trade = Stock(stock_name, current_purchase_total, share_price, datetime.datetime.now())
-            # add current trade to my stocks dickt
-            curr = self.owned.setdefault(stock_name, 0)
-            self.owned[stock_name] = curr + current_purchase_total
-            # subtract cost from balance
-            self.remove_money(cost)
-            self.trades.append(trade)
-
-            # subtract trade fee
-            self.balance -= cost * self.fee
+            share_price = self.get_share_price(stock_name)
         except KeyError:
             raise ValueError(f"{stock_name} is not a valid stock name for Yahoo's API")
+        # check how much the money I spent can get me
+        self._fill(stock_name, cost / share_price, share_price, cost * self.fee)
 
     def buy_shares(self,stock_name, amount):
         # check if stock name exists
         try:
             # if it is, get share price
-            share_price = float(yf.Ticker(stock_name).get_info()['currentPrice'])
-            # how much will it cost?
-            cost = amount * share_price
-            assert cost <= self.balance, f"Can't buy more than you got. " \
-                                         f"Offer: {cost}, Total balance {self.balance}"
-
-            trade = Stock(stock_name, amount, share_price, datetime.datetime.now())
-            # add current trade to my stocks dickt
-            curr = self.owned.setdefault(stock_name, 0)
-            self.owned[stock_name] = curr + amount
-            # subtract cost from balance
-            self.remove_money(cost)
-            self.trades.append(trade)
-
-            # subtract trade fee
-            self.balance -= cost * self.fee
+            share_price = self.get_share_price(stock_name)
         except KeyError:
             raise ValueError(f"{stock_name} is not a valid stock name for Yahoo's API")
+        # how much will it cost?
+        cost = amount * share_price
+        assert cost <= self.balance, f"Can't buy more than you got. " \
+                                     f"Offer: {cost}, Total balance {self.balance}"
+        self._fill(stock_name, amount, share_price, cost * self.fee)
 
     def sell(self, stock_name, amount=None, value=None):
         assert (amount is None) ^ (value is None), "You must sell using value or amount as argument!"
         if amount is not None:
             self.sell_by_amount(amount, stock_name)
         elif value is not None:
-            self.sell_by_value(value, stock_name)
-            # subtract trade fee
-            self.balance -= value * self.fee
-
+            self.sell_by_value(value, stock_name, charge_fee=True)
         else:
             raise Exception(f"Invalid arguments passed to self.sell(). {amount=}, {value=}")
 
     def sell_by_amount(self, amount, stock_name):
         # sell the amount specified
         try:
-            share_price = float(yf.Ticker(stock_name).get_info()['currentPrice'])
-            assert stock_name in self.owned.keys() and amount <= self.owned[stock_name], \
-                f"Insufficient stock volume ({self.owned.get(stock_name) or 0})!"
-            # add sell and subtract amount and add balance accordion-ly
-            trade = Stock(stock_name, -amount, share_price, datetime.datetime.now())
-            self.trades.append(trade)
-            self.owned[stock_name] -= amount
-            revenue = amount * share_price
-            # add balance
-            self.add_money(revenue)
-            # subtract trade fee
-            self.balance -= revenue * self.fee
+            share_price = self.get_share_price(stock_name)
         except KeyError:
             raise ValueError(f"{stock_name} is not a valid stock name for Yahoo's API")
+        assert stock_name in self.owned.keys() and amount <= self.owned[stock_name], \
+            f"Insufficient stock volume ({self.owned.get(stock_name) or 0})!"
+        revenue = amount * share_price
+        self._fill(stock_name, -amount, share_price, revenue * self.fee)
 
-    def sell_by_value(self, value, stock_name):
+    def sell_by_value(self, value, stock_name, charge_fee=False):
         # assume I got 5,000 dollars of stock A
         # I want to sell 500$
         # share is 100$, so I sell 5 shares
-        # sell the amount specified
+        # (only sell() charges the trade fee on this path)
         try:
-            share_price = float(yf.Ticker(stock_name).get_info()['currentPrice'])
-            amount = value / share_price
-            assert stock_name in self.owned.keys() and amount <= self.owned[stock_name], \
-                f"Insufficient stock volume ({self.owned.get(stock_name) or 0})!"
-            # add sell and subtract amount and add balance accordion-ly
-            trade = Stock(stock_name, -amount, share_price, datetime.datetime.now())
-            self.trades.append(trade)
-            self.owned[stock_name] -= amount
-            # add balance
-            self.add_money(amount * share_price)
+            share_price = self.get_share_price(stock_name)
         except KeyError:
             raise ValueError(f"{stock_name} is not a valid stock name for Yahoo's API")
+        amount = value / share_price
+        assert stock_name in self.owned.keys() and amount <= self.owned[stock_name], \
+            f"Insufficient stock volume ({self.owned.get(stock_name) or 0})!"
+        self._fill(stock_name, -amount, share_price, value * self.fee if charge_fee else 0)
+
+    def execute_batch(self, orders, prices=None):
+        """Execute many orders as one unit: every price is fetched in one batch, the whole batch is
+        checked against balance and holdings first, and then either every order fills or none does.
+
+        Fees and checks are the same as buy/buy_shares/sell. `prices` can supply quotes that were
+        already fetched. Returns the fills as Stock objects.
+        """
+        orders = [order if isinstance(order, Order) else Order(*order) for order in orders]
+        symbols = {order.stock_name for order in orders}
+        if prices is None:
+            prices = self.price_provider.get_prices(symbols)
+        fills = []
+        balance = self.balance
+        owned = dict()
+        for i, order in enumerate(orders):
+            assert order.side in ('buy', 'sell'), f"Order {i}: side must be 'buy' or 'sell', not {order.side!r}"
+            assert (order.amount is None) ^ (order.value is None), \
+                f"Order {i}: give either amount or value for {order.stock_name}"
+            if order.stock_name not in prices:
+                raise ValueError(f"Order {i}: {order.stock_name} is not a valid stock name for Yahoo's API")
+            share_price = prices[order.stock_name]
+            if order.side == 'buy':
+                cost = order.value if order.value is not None else order.amount * share_price
+                assert cost <= balance, f"Order {i}: Can't buy more than you got. " \
+                                        f"Offer: {cost}, Total balance {balance}"
+                amount = order.amount if order.amount is not None else cost / share_price
+            else:
+                amount = -(order.amount if order.amount is not None else order.value / share_price)
+                held = owned.get(order.stock_name, self.owned.get(order.stock_name))
+                assert held is not None and -amount <= held, \
+                    f"Order {i}: Insufficient stock volume ({held or 0})!"
+                cost = -amount * share_price if order.amount is not None else order.value
+            fee = cost * self.fee
+            balance -= amount * share_price + fee
+            owned[order.stock_name] = owned.get(order.stock_name, self.owned.get(order.stock_name, 0)) + amount
+            fills.append((order.stock_name, amount, share_price, fee))
+        return [self._fill(*fill) for fill in fills]
+
+    def mark_to_market(self, max_workers: int = MAX_WORKERS, timeout: float = FETCH_TIMEOUT) -> Valuation:
+        # price every held symbol in one concurrent batch instead of one request per position
+        held = {name: amount for name, amount in self.owned.items() if amount}
+        with metrics.span('trader.mark_to_market'):
+            prices = self.price_provider.get_prices(list(held), max_workers, timeout)
+        positions = {name: amount * prices[name] for name, amount in held.items() if name in prices}
+        missing = [name for name in held if name not in prices]
+        return Valuation(self.balance + sum(positions.values()), self.balance, positions, prices, missing)
 
     def get_revenue_from(self, from_date=None):
-        sorted_trades = sorted(self.trades, key=lambda x: x.purchase_time)
-        if from_date is None:
-            return sum(s.amount*s.share_value for s in sorted_trades)
-        else:
+        if from_date is not None:
             assert isinstance(from_date, datetime.datetime)
-            return sum(s.amount*s.share_value for s in sorted_trades if s.puchase_time >= from_date)
-
-
-def load_trader_from_file(file):
-    # load it
-    with open(file, 'rb') as file2:
-        s1_new = pickle.load(file2)
-        return s1_new
+        return self.trades.revenue(from_date)
+
+def load_trader_from_file(file, username=None):
+    with metrics.span('profile.load'):
+        if str(file).endswith(JOURNAL_SUFFIX):
+            return load_journaled_trader(file)
+        if str(file).endswith(SQLITE_SUFFIXES):
+            # a database can hold many profiles, `username` picks one
+            with ProfileStore(file) as store:
+                return store.load(username)
+        # load it
+        with open(file, 'rb') as file2:
+            s1_new = pickle.load(file2)
+            return s1_new
 
 
 def store_trader_in_file(trader, file):
-    # save it
-    with open(file, 'wb') as file:
-        pickle.dump(trader, file)
+    with metrics.span('profile.save'):
+        if str(file).endswith(JOURNAL_SUFFIX):
+            # only what happened since the last save still has to reach the disk
+            return store_journaled_trader(trader, file)
+        if str(file).endswith(SQLITE_SUFFIXES):
+            with ProfileStore(file) as store:
+                return store.save(trader)
+        # save it
+        with open(file, 'wb') as file:
+            pickle.dump(trader, file)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,233 @@
+import csv
+import datetime
+import os
+from collections import namedtuple
+
+import numpy as np
+
+from quotes import PriceProvider
+from Trader import Trader
+
+FIELDS = ('open', 'high', 'low', 'close', 'volume')
+# trades in a backtest are stamped at the close of their bar
+BAR_TIME = datetime.time(16, 0)
+
+
+class Bars:
+    """Daily OHLCV bars for many symbols on one shared date axis.
+
+    Each field is a (dates x symbols) float64 matrix, NaN where a symbol has no bar on that date.
+    """
+
+    def __init__(self, symbols, dates, open, high, low, close, volume=None):
+        self.symbols = list(symbols)
+        self.columns = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.dates = np.asarray(dates, dtype='datetime64[D]')
+        self.open = np.asarray(open, dtype=np.float64)
+        self.high = np.asarray(high, dtype=np.float64)
+        self.low = np.asarray(low, dtype=np.float64)
+        self.close = np.asarray(close, dtype=np.float64)
+        self.volume = np.zeros_like(self.close) if volume is None else np.asarray(volume, dtype=np.float64)
+        assert self.close.shape == (len(self.dates), len(self.symbols)), "bars don't match dates x symbols"
+
+    def __len__(self):
+        return len(self.dates)
+
+    def datetimes(self):
+        return [datetime.datetime.combine(day, BAR_TIME) for day in self.dates.astype(datetime.date)]
+
+    def select(self, symbols):
+        columns = [self.columns[symbol] for symbol in symbols]
+        return Bars(symbols, self.dates, *(getattr(self, field)[:, columns] for field in FIELDS))
+
+    def between(self, start=None, end=None):
+        """Bars dated in [start, end)."""
+        lo = 0 if start is None else np.searchsorted(self.dates, np.datetime64(start, 'D'))
+        hi = len(self.dates) if end is None else np.searchsorted(self.dates, np.datetime64(end, 'D'))
+        return Bars(self.symbols, self.dates[lo:hi], *(getattr(self, field)[lo:hi] for field in FIELDS))
+
+    def filled_close(self):
+        return forward_fill(self.close)
+
+
+def forward_fill(matrix):
+    """Replace NaNs with the last valid value above them (leading NaNs stay NaN)."""
+    rows = np.where(np.isnan(matrix), 0, np.arange(matrix.shape[0])[:, None])
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    return matrix[rows, np.arange(matrix.shape[1])]
+
+
+def read_bars_csv(path):
+    """Read one symbol's bars from a csv with Date/Open/High/Low/Close[/Volume] columns (e.g. a yfinance dump)."""
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        header = [name.strip().lower() for name in next(reader)]
+        date_col = header.index('date')
+        columns = [header.index(field) if field in header else None for field in FIELDS]
+        dates, values = [], []
+        for row in reader:
+            if not row:
+                continue
+            dates.append(row[date_col][:10])
+            values.append([float(row[i]) if i is not None and row[i] else np.nan for i in columns])
+    return np.array(dates, dtype='datetime64[D]'), np.array(values, dtype=np.float64).reshape(-1, len(FIELDS))
+
+
+def load_bars(directory, symbols=None):
+    """Load <SYMBOL>.csv files from `directory` and align them on the union of their dates."""
+    if symbols is None:
+        symbols = sorted(name[:-4] for name in os.listdir(directory) if name.endswith('.csv'))
+    per_symbol = [read_bars_csv(os.path.join(directory, f"{symbol}.csv")) for symbol in symbols]
+    return align_bars(symbols, per_symbol)
+
+
+def align_bars(symbols, per_symbol):
+    """Build Bars from a (dates, values[n x 5]) pair per symbol."""
+    all_dates = np.unique(np.concatenate([dates for dates, _ in per_symbol])) if per_symbol \
+        else np.array([], dtype='datetime64[D]')
+    matrices = np.full((len(FIELDS), len(all_dates), len(symbols)), np.nan)
+    for j, (dates, values) in enumerate(per_symbol):
+        rows = np.searchsorted(all_dates, dates)
+        matrices[:, rows, j] = values.T
+    return Bars(symbols, all_dates, *matrices)
+
+
+class SimulatedClock:
+    """Stands in for datetime.now: returns the time of the bar the backtest is on."""
+
+    def __init__(self, bars):
+        self.times = bars.datetimes()
+        self.index = 0
+
+    def __call__(self):
+        return self.times[self.index]
+
+
+class BarPriceProvider(PriceProvider):
+    def __init__(self, bars, clock, field='close'):
+        self.bars = bars
+        self.clock = clock
+        self.prices = getattr(bars, field)
+
+    def get_price(self, symbol: str) -> float:
+        price = self.prices[self.clock.index, self.bars.columns[symbol]]
+        if np.isnan(price):
+            raise KeyError(symbol)
+        return float(price)
+
+    def get_prices(self, symbols, max_workers=None, timeout=None) -> dict:
+        row = self.prices[self.clock.index]
+        columns = self.bars.columns
+        return {symbol: float(row[columns[symbol]]) for symbol in symbols
+                if symbol in columns and not np.isnan(row[columns[symbol]])}
+
+
+class Strategy:
+    """Backtest strategy. Override prepare for vectorized work over the whole history, on_bar to trade."""
+
+    def prepare(self, bars):
+        """Return a boolean mask over the bars on which on_bar must run (None means every bar)."""
+        return None
+
+    def on_bar(self, bar):
+        pass
+
+
+# what on_bar receives: bar index, its date, the trader to place orders with and the full Bars
+Bar = namedtuple('Bar', ['index', 'date', 'trader', 'bars'])
+
+BacktestResult = namedtuple('BacktestResult', ['trader', 'dates', 'equity', 'cash', 'holdings_value'])
+
+
+def run_backtest(bars, strategy, initial_balance: float = 10000, fee: float = 0, cost_basis: str = 'fifo'):
+    """Replay `bars` through `strategy` with a Trader pricing orders at each bar's close.
+
+    Indicators are meant to be computed in strategy.prepare over the whole matrix at once; the Python
+    loop only visits the bars it marks, and the equity curve is rebuilt from the ledger afterwards
+    in one vectorized pass.
+    """
+    clock = SimulatedClock(bars)
+    trader = Trader('backtest', fee, initial_balance, BarPriceProvider(bars, clock), cost_basis, clock)
+    active = strategy.prepare(bars)
+    steps = range(len(bars)) if active is None else np.flatnonzero(active)
+    for index in steps:
+        clock.index = int(index)
+        strategy.on_bar(Bar(clock.index, bars.dates[index], trader, bars))
+    cash, holdings_value = equity_curve(trader.trades, bars, initial_balance, clock.times)
+    return BacktestResult(trader, bars.dates, cash + holdings_value, cash, holdings_value)
+
+
+def ledger_arrays(ledger):
+    """Zero-copy numpy views of a TradeLedger's (symbol id, amount, share value, fee, timestamp) columns."""
+    if not len(ledger):
+        return np.zeros(0, np.int64), np.zeros(0), np.zeros(0), np.zeros(0), np.zeros(0)
+    return (np.frombuffer(ledger.column('symbol'), dtype=np.int64),
+            *(np.frombuffer(ledger.column(name), dtype=np.float64)
+              for name in ('amount', 'share_value', 'fee', 'timestamp')))
+
+
+def holdings_matrix(ledger, bars, times=None):
+    """Shares held of each bars symbol at the end of every bar, and the cash each bar's trades moved."""
+    times = bars.datetimes() if times is None else times
+    bar_times = np.array([when.timestamp() for when in times])
+    symbols, amount, price, fee, timestamp = ledger_arrays(ledger)
+    # ledger symbol id -> bars column (-1 for symbols the bars don't cover)
+    to_column = np.array([bars.columns.get(name, -1) for name in ledger.symbols] + [-1], dtype=np.int64)
+    columns = to_column[symbols]
+    rows = np.searchsorted(bar_times, timestamp, side='right') - 1
+    keep = (rows >= 0) & (columns >= 0)
+    deltas = np.zeros((len(bars), len(bars.symbols)))
+    np.add.at(deltas, (rows[keep], columns[keep]), amount[keep])
+    flows = np.zeros(len(bars))
+    np.add.at(flows, rows[rows >= 0], -(amount * price + fee)[rows >= 0])
+    return np.cumsum(deltas, axis=0), flows
+
+
+def equity_curve(ledger, bars, initial_balance, times=None):
+    """(cash, holdings value) at the end of every bar."""
+    holdings, flows = holdings_matrix(ledger, bars, times)
+    cash = initial_balance + np.cumsum(flows)
+    holdings_value = np.nansum(holdings * bars.filled_close(), axis=1)
+    return cash, holdings_value
+
+
+def moving_average(matrix, window):
+    """Trailing mean over `window` rows (NaN until the window is full)."""
+    cumulative = np.cumsum(np.nan_to_num(matrix), axis=0)
+    result = np.full_like(matrix, np.nan)
+    result[window - 1:] = cumulative[window - 1:]
+    result[window:] -= cumulative[:-window]
+    result[window - 1:] /= window
+    return result
+
+
+class MovingAverageCrossover(Strategy):
+    """Buy `stake` (a fraction of the balance) of a symbol when its fast average crosses above the slow one,
+    sell the whole position when it crosses back below."""
+
+    def __init__(self, fast=20, slow=50, stake=0.1):
+        assert 0 < fast < slow and 0 < stake <= 1
+        self.fast = fast
+        self.slow = slow
+        self.stake = stake
+
+    def prepare(self, bars):
+        close = bars.filled_close()
+        above = moving_average(close, self.fast) > moving_average(close, self.slow)
+        crossed = np.zeros_like(above)
+        crossed[1:] = above[1:] != above[:-1]
+        crossed &= ~np.isnan(bars.close)
+        self.buys = crossed & above
+        self.sells = crossed & ~above
+        return crossed.any(axis=1)
+
+    def on_bar(self, bar):
+        trader, symbols = bar.trader, bar.bars.symbols
+        for j in np.flatnonzero(self.sells[bar.index]):
+            held = trader.owned.get(symbols[j], 0)
+            if held > 0:
+                trader.sell(symbols[j], amount=held)
+        for j in np.flatnonzero(self.buys[bar.index]):
+            cost = trader.balance * self.stake / (1 + trader.fee)
+            if cost > 0:
+                trader.buy(symbols[j], cost)
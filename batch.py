@@ -0,0 +1,53 @@
+import argparse
+import csv
+import json
+import time
+
+from quotes import InMemoryPriceProvider
+from Trader import Order, load_trader_from_file, store_trader_in_file
+
+
+def _number(value):
+    return None if value in (None, '') else float(value)
+
+
+def read_orders(path):
+    """Orders from a .jsonl file (one object per line) or a csv with a header row.
+
+    Both use the keys side, symbol, and one of amount / value.
+    """
+    if path.endswith('.jsonl'):
+        with open(path) as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    else:
+        with open(path, newline='') as f:
+            rows = list(csv.DictReader(f))
+    return [Order(row['side'].strip().lower(), row['symbol'].strip().upper(),
+                  _number(row.get('amount')), _number(row.get('value'))) for row in rows]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Execute a file of orders against a saved profile, without the GUI")
+    parser.add_argument('profile', help="profile to trade with (.pickle or .journal)")
+    parser.add_argument('orders', help="orders file (.csv or .jsonl)")
+    parser.add_argument('--out', help="where to save the profile (defaults to the profile itself)")
+    parser.add_argument('--prices', help="json file of {symbol: price} to trade at instead of live quotes")
+    parser.add_argument('--dry-run', action='store_true', help="validate and price the batch, but don't save")
+    args = parser.parse_args()
+
+    trader = load_trader_from_file(args.profile)
+    if args.prices:
+        with open(args.prices) as f:
+            trader.price_provider = InMemoryPriceProvider(json.load(f))
+    orders = read_orders(args.orders)
+    start = time.perf_counter()
+    if args.dry_run and trader.journal is not None:
+        # a journaled trader writes every fill straight to its file
+        trader.journal.close()
+        trader.journal = None
+    fills = trader.execute_batch(orders)
+    elapsed = time.perf_counter() - start
+    print(f"Executed {len(fills)} orders on {len({order.stock_name for order in orders})} symbols "
+          f"in {elapsed:.3f}s, balance is now {trader.balance:.2f}")
+    if not args.dry_run:
+        store_trader_in_file(trader, args.out or args.profile)
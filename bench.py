@@ -0,0 +1,220 @@
+"""Benchmarks for the trading, persistence and ticker loading paths.
+
+    python bench.py --sizes 1000,100000 --out bench_results.json
+    python bench.py --baseline bench_results.json     # compare a new run against an old one
+
+Prices come from a seeded in-memory provider, so runs are reproducible and need no network.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from quotes import InMemoryPriceProvider
+from Trader import Trader, load_trader_from_file, store_trader_in_file
+
+SYMBOLS = [f"SYM{i}" for i in range(100)]
+DEFAULT_SIZES = (1000, 10000, 100000)
+
+
+def fake_prices(seed=0):
+    rng = random.Random(seed)
+    return InMemoryPriceProvider({symbol: rng.uniform(5, 500) for symbol in SYMBOLS})
+
+
+def make_trader(size, seed=0):
+    """A trader with `size` trades in its ledger (written to the ledger directly, so 10M stays quick)."""
+    rng = random.Random(seed)
+    trader = Trader('bench', 0.001, 1e12, fake_prices(seed))
+    start = datetime.datetime(2020, 1, 1).timestamp()
+    for i in range(size):
+        symbol = rng.choice(SYMBOLS)
+        trader.trades.add(symbol, rng.uniform(-10, 10), rng.uniform(5, 500), 0.01, start + i * 60)
+        trader.owned[symbol] = trader.owned.get(symbol, 0) + 10
+    return trader
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def measure(name, size, operation, repeat):
+    """Time `operation` `repeat` times, then run it once more under tracemalloc for its peak memory."""
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        operation()
+        latencies.append(time.perf_counter() - start)
+    tracemalloc.start()
+    operation()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    latencies.sort()
+    total = sum(latencies)
+    return {'name': name, 'size': size, 'repeat': repeat,
+            'ops_per_s': repeat / total if total else float('inf'),
+            'p50_ms': percentile(latencies, 0.5) * 1000, 'p90_ms': percentile(latencies, 0.9) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000, 'max_ms': latencies[-1] * 1000,
+            'peak_mb': peak / 2 ** 20}
+
+
+def bench_orders(size):
+    trader = make_trader(size)
+    rng = random.Random(1)
+
+    def order():
+        symbol = rng.choice(SYMBOLS)
+        if rng.random() < 0.5:
+            trader.buy(symbol, 100)
+        else:
+            trader.sell(symbol, amount=0.01)
+    return [measure('order', size, order, 2000)]
+
+
+def bench_revenue(size):
+    trader = make_trader(size)
+    middle = datetime.datetime.fromtimestamp(trader.trades.timestamp(len(trader.trades) // 2))
+    return [measure('get_revenue_from', size, lambda: trader.get_revenue_from(middle), 20)]
+
+
+def bench_persistence(size):
+    trader = make_trader(size)
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for suffix in ('.pickle', '.journal'):
+            path = os.path.join(directory, 'bench' + suffix)
+            store_trader_in_file(trader, path)
+            if suffix == '.journal':
+                # an attached journal only has to persist what changed since the last save
+                def save_after_trade():
+                    trader.buy(SYMBOLS[0], 10)
+                    store_trader_in_file(trader, path)
+                results.append(measure('save_after_trade' + suffix, size, save_after_trade, 20))
+                trader.journal.close()
+                trader.journal = None
+            else:
+                results.append(measure('store' + suffix, size, lambda: store_trader_in_file(trader, path), 5))
+            results.append(measure('load' + suffix, size, lambda: load_trader_from_file(path), 5))
+    return results
+
+
+def bench_tickers(_):
+    from tickers import TickerIndex, parse_tickers
+    index = TickerIndex.load()
+    return [measure('tickers_parse_csv', 0, parse_tickers, 5),
+            measure('tickers_index_load', 0, TickerIndex.load, 50),
+            measure('tickers_prefix', 0, lambda: index.prefix('AA', 50), 1000)]
+
+
+def bench_history_model(size):
+    try:
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        from PyQt5.QtWidgets import QApplication
+        from history_model import TradeHistoryModel
+    except ImportError:
+        return []
+    app = QApplication.instance() or QApplication(sys.argv)
+    trader = make_trader(size)
+    model = TradeHistoryModel(trader.trades)
+
+    def refresh_after_trade():
+        trader.buy(SYMBOLS[0], 10)
+        model.sync()
+    return [measure('history_refresh', size, refresh_after_trade, 200)]
+
+
+def bench_ticks(size):
+    """Synthetic ticks for the held symbols, published through a QuoteStream into a LivePortfolio."""
+    from streaming import LivePortfolio, QuoteStream
+    from synthetic import SyntheticMarket
+    trader = make_trader(size)
+    market = SyntheticMarket(universe=None)
+    stream = QuoteStream()
+    live = LivePortfolio(stream, trader.balance, trader.owned, trader.price_provider.prices)
+
+    def publish():
+        which, prices = market.ticks(SYMBOLS, 100000, prices=trader.price_provider.prices)
+        publish_tick = stream.publish
+        for i, price in zip(which.tolist(), prices.tolist()):
+            publish_tick(SYMBOLS[i], price)
+    result = [measure('ticks_100k', size, publish, 5)]
+    live.close()
+    return result
+
+
+BENCHMARKS = {
+    'orders': bench_orders,
+    'revenue': bench_revenue,
+    'persistence': bench_persistence,
+    'history': bench_history_model,
+    'ticks': bench_ticks,
+}
+
+
+def run(sizes, names):
+    results = []
+    if 'tickers' in names:
+        results += bench_tickers(None)
+    for size in sizes:
+        for name in names:
+            if name in BENCHMARKS:
+                results += BENCHMARKS[name](size)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print each result next to its baseline; returns the benchmarks whose p50 got slower than `threshold`."""
+    previous = {(row['name'], row['size']): row for row in baseline['results']}
+    regressions = []
+    for row in results:
+        old = previous.get((row['name'], row['size']))
+        if old is None or not old['p50_ms']:
+            continue
+        ratio = row['p50_ms'] / old['p50_ms']
+        flag = ' REGRESSION' if ratio > 1 + threshold else ''
+        print(f"{row['name']:>28} {row['size']:>9}  p50 {old['p50_ms']:.4f} -> {row['p50_ms']:.4f} ms "
+              f"({ratio:.2f}x){flag}")
+        if flag:
+            regressions.append(row)
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help="comma separated ledger sizes (e.g. 1000,10000,1000000,10000000)")
+    parser.add_argument('--only', default=','.join(['tickers', *BENCHMARKS]),
+                        help="comma separated benchmarks to run")
+    parser.add_argument('--out', default='bench_results.json')
+    parser.add_argument('--baseline', help="earlier results file to compare against")
+    parser.add_argument('--threshold', type=float, default=0.2, help="allowed p50 slowdown before flagging")
+    args = parser.parse_args()
+
+    results = run([int(size) for size in args.sizes.split(',')], args.only.split(','))
+    report = {'meta': {'time': datetime.datetime.now().isoformat(), 'python': sys.version.split()[0],
+                       'platform': platform.platform(), 'revision': git_revision()},
+              'results': results}
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=1)
+    for row in results:
+        print(f"{row['name']:>28} {row['size']:>9}  {row['ops_per_s']:>12.1f} ops/s  p50 {row['p50_ms']:.4f} "
+              f"p99 {row['p99_ms']:.4f} ms  peak {row['peak_mb']:.1f} MB")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        sys.exit(1 if regressions else 0)
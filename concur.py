@@ -1,18 +1,6 @@
-def get_tickers_from_csv(with_dots=False):
-
-    import csv
-    tickers = []
-    with open('valid_tickers.csv', newline='') as csvfile:
 
-        spamreader = csv.reader(csvfile, delimiter=' ', quotechar='|')
-        flag = True
-        for row in spamreader:
-            if flag:
-                flag = False
-                continue
-            for elem in row:
-                if with_dots or '.' not in elem:
-                    tickers.append(elem[2:-2])
-                break
-    return sorted(tickers)
 
+def get_tickers_from_csv(with_dots=False):
+    # served from the compiled index, which is rebuilt from valid_tickers.csv only when the csv changes
+    from tickers import TickerIndex
+    return list(TickerIndex.load(with_dots=with_dots))
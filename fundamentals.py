@@ -0,0 +1,157 @@
+import json
+import os
+import re
+
+import numpy as np
+
+from tickers import TICKERS_CSV
+
+# the csv's header row lists these in a different order; this is the order the values are actually in
+COLUMNS = ('ticker', 'date', 'currency', 'market_cap', 'total_revenue', 'free_cash_flow', 'total_assets', 'valid')
+NUMERIC = ('market_cap', 'total_revenue', 'free_cash_flow', 'total_assets')
+# metrics computed from the stored columns on demand
+DERIVED = {
+    'fcf_yield': lambda store: store['free_cash_flow'] / store['market_cap'],
+    'price_to_sales': lambda store: store['market_cap'] / store['total_revenue'],
+    'asset_ratio': lambda store: store['market_cap'] / store['total_assets'],
+}
+
+_ROW = re.compile(r"\('([^']*)', datetime\.date\((\d+), (\d+), (\d+)\), (None|'[^']*'), "
+                  r"(\S+), (\S+), (\S+), (\S+), (True|False)\)")
+
+
+def _number(text):
+    return np.nan if text == 'None' else float(text)
+
+
+def parse_fundamentals(csv_path=TICKERS_CSV):
+    """Parse valid_tickers.csv into a dict of numpy columns."""
+    rows = []
+    with open(csv_path, encoding='utf-8') as f:
+        next(f, None)
+        for line in f:
+            match = _ROW.match(line)
+            if match:
+                rows.append(match.groups())
+    ticker, year, month, day, currency, *numbers, valid = zip(*rows) if rows else ((),) * 10
+    columns = {
+        'ticker': np.array(ticker, dtype='U16'),
+        'date': np.array([f"{y}-{int(m):02d}-{int(d):02d}" for y, m, d in zip(year, month, day)],
+                         dtype='datetime64[D]'),
+        'currency': np.array([c.strip("'") if c != 'None' else '' for c in currency], dtype='U3'),
+        'valid': np.array([v == 'True' for v in valid], dtype=bool),
+    }
+    for name, values in zip(NUMERIC, numbers):
+        columns[name] = np.array([_number(value) for value in values], dtype=np.float64)
+    return columns
+
+
+class FundamentalsStore:
+    """The fundamentals in valid_tickers.csv as NumPy columns, one row per ticker.
+
+    The first load parses the csv and writes every column as a .npy file into a cache directory;
+    later loads memory map those files, and the cache is rebuilt when the csv's mtime/size change.
+    Where the cache can't be written, every load parses the csv.
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    @classmethod
+    def load(cls, csv_path=TICKERS_CSV, cache_dir=None):
+        cache_dir = cache_dir or os.path.splitext(csv_path)[0] + '.columns'
+        stat = os.stat(csv_path)
+        stamp = {'mtime': stat.st_mtime_ns, 'size': stat.st_size}
+        try:
+            with open(os.path.join(cache_dir, 'meta.json')) as f:
+                if json.load(f) != stamp:
+                    raise ValueError("stale fundamentals cache")
+            return cls({name: np.load(os.path.join(cache_dir, f"{name}.npy"), mmap_mode='r') for name in COLUMNS})
+        except (OSError, ValueError):
+            columns = parse_fundamentals(csv_path)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            for name, values in columns.items():
+                np.save(os.path.join(cache_dir, f"{name}.npy"), values)
+            # written last: a cache without up to date meta is never trusted
+            with open(os.path.join(cache_dir, 'meta.json'), 'w') as f:
+                json.dump(stamp, f)
+        except OSError:
+            pass  # nowhere to write the cache (e.g. a read-only checkout), the parsed columns still do
+        return cls(columns)
+
+    def __len__(self):
+        return len(self.columns['ticker'])
+
+    def __getitem__(self, name):
+        if name in DERIVED:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return DERIVED[name](self)
+        return self.columns[name]
+
+    def screen(self):
+        return Screen(self)
+
+    def row(self, i):
+        return {name: self.columns[name][i].item() for name in COLUMNS}
+
+    def lookup(self, ticker):
+        matches = np.flatnonzero(self.columns['ticker'] == ticker)
+        if not len(matches):
+            raise KeyError(ticker)
+        return self.row(matches[0])
+
+
+class Screen:
+    """Chainable filters over a FundamentalsStore, evaluated as boolean masks over whole columns.
+
+        store.screen().where('market_cap', min=1e9).currency('USD').top('fcf_yield', 10)
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.mask = np.ones(len(store), dtype=bool)
+
+    def where(self, column, min=None, max=None):
+        values = self.store[column]
+        # rows missing the value never pass a numeric filter
+        self.mask &= ~np.isnan(values)
+        if min is not None:
+            self.mask &= values >= min
+        if max is not None:
+            self.mask &= values <= max
+        return self
+
+    def currency(self, *codes):
+        self.mask &= np.isin(self.store['currency'], codes)
+        return self
+
+    def valid(self):
+        self.mask &= self.store['valid']
+        return self
+
+    def without_dots(self):
+        self.mask &= np.char.find(self.store['ticker'], '.') < 0
+        return self
+
+    def indices(self, sort_by=None, descending=True, limit=None):
+        rows = np.flatnonzero(self.mask)
+        if sort_by is None:
+            return rows if limit is None else rows[:limit]
+        values = np.asarray(self.store[sort_by])[rows]
+        rows, values = rows[~np.isnan(values)], values[~np.isnan(values)]
+        keys = -values if descending else values
+        if limit is not None and limit < len(rows):
+            # only the best `limit` rows need to be sorted
+            best = np.argpartition(keys, limit)[:limit]
+            rows, keys = rows[best], keys[best]
+        return rows[np.argsort(keys, kind='stable')]
+
+    def top(self, column, n=10, descending=True):
+        return [self.store.row(i) for i in self.indices(column, descending, n)]
+
+    def tickers(self, sort_by=None, descending=True, limit=None):
+        return self.store['ticker'][self.indices(sort_by, descending, limit)].tolist()
+
+    def count(self):
+        return int(self.mask.sum())
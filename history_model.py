@@ -0,0 +1,142 @@
+import datetime
+
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, Qt
+
+HEADERS = ("Stock name", "Amount", "Share value", "Purchase time")
+
+
+class TradeHistoryModel(QAbstractTableModel):
+    """Table model over a TradeLedger.
+
+    Cells are formatted only when the view asks for them (i.e. when they are visible), new fills are
+    announced as inserted rows, and sorting/filtering keep a list of ledger row numbers instead of
+    copying any trade data.
+    """
+
+    def __init__(self, ledger=None, parent=None):
+        super().__init__(parent)
+        self.ledger = ledger
+        self._count = len(ledger) if ledger is not None else 0
+        self._last_time = ledger.timestamp(self._count - 1) if self._count else None  # to notice out of order inserts
+        self._rows = None  # ledger row per view row when sorted/filtered, None means ledger order
+        self._sort = None  # (column, order)
+        self._filter = ''
+
+    def set_ledger(self, ledger):
+        self.beginResetModel()
+        self.ledger = ledger
+        self._count = len(ledger) if ledger is not None else 0
+        self._last_time = ledger.timestamp(self._count - 1) if self._count else None
+        self._rows = self._arrange()
+        self.endResetModel()
+
+    def sync(self):
+        """Pick up fills appended to the ledger since the last call."""
+        if self.ledger is None:
+            return
+        count = len(self.ledger)
+        if count == self._count:
+            return
+        if count < self._count or (self._count and self.ledger.timestamp(self._count - 1) != self._last_time):
+            # rows were removed or a trade was inserted before the end (a backdated import): start over
+            self.beginResetModel()
+            self._count = count
+            self._rows = self._arrange()
+            self._last_time = self.ledger.timestamp(count - 1) if count else None
+            self.endResetModel()
+            return
+        new_rows = range(self._count, count)
+        self._count = count
+        self._last_time = self.ledger.timestamp(count - 1)
+        if self._rows is None:
+            self.beginInsertRows(QModelIndex(), new_rows[0], new_rows[-1])
+            self.endInsertRows()
+            return
+        # sorted or filtered: place only the new fills, each at its position in the current order
+        for i in new_rows:
+            if self._filter and not self.ledger.name(i).startswith(self._filter):
+                continue
+            position = self._position(i)
+            self.beginInsertRows(QModelIndex(), position, position)
+            self._rows.insert(position, i)
+            self.endInsertRows()
+
+    def _position(self, i):
+        """Where ledger row `i` (newer than every row shown) goes in _rows; the same place sorted() would put it."""
+        column, order = self._sort if self._sort is not None else (3, Qt.AscendingOrder)
+        reverse = order == Qt.DescendingOrder
+        if column == 3:
+            return 0 if reverse else len(self._rows)
+        key = (self.ledger.name, self.ledger.amount, self.ledger.share_value)[column]
+        value = key(i)
+        # after every row with an equal key, as the stable sort keeps ledger order among equals
+        lo, hi = 0, len(self._rows)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            other = key(self._rows[mid])
+            if (other >= value) if reverse else (other <= value):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def set_filter(self, text):
+        self.beginResetModel()
+        self._filter = text.strip().upper()
+        self._rows = self._arrange()
+        self.endResetModel()
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.layoutAboutToBeChanged.emit()
+        self._sort = (column, order)
+        self._rows = self._arrange()
+        self.layoutChanged.emit()
+
+    def _arrange(self):
+        ledger = self.ledger
+        if ledger is None:
+            return None
+        if not self._filter and (self._sort is None or self._sort == (3, Qt.AscendingOrder)):
+            return None  # the ledger is already in time order
+        rows = range(self._count)
+        if self._filter:
+            symbols = [name for name in ledger.symbols if name.startswith(self._filter)]
+            rows = [i for i in ledger.rows(symbols=symbols) if i < self._count]
+        if self._sort is not None:
+            column, order = self._sort
+            reverse = order == Qt.DescendingOrder
+            if column == 3:
+                rows = list(reversed(rows)) if reverse else list(rows)
+            else:
+                key = (ledger.name, ledger.amount, ledger.share_value)[column]
+                rows = sorted(rows, key=key, reverse=reverse)
+        return list(rows)
+
+    def ledger_row(self, row):
+        return row if self._rows is None else self._rows[row]
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self._count if self._rows is None else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        i = self.ledger_row(index.row())
+        column = index.column()
+        if column == 0:
+            return self.ledger.name(i)
+        if column == 1:
+            return f"{self.ledger.amount(i):g}"
+        if column == 2:
+            return f"{self.ledger.share_value(i):g}"
+        return f"{datetime.datetime.fromtimestamp(self.ledger.timestamp(i))}"
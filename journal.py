@@ -0,0 +1,338 @@
+import json
+import os
+import pickle
+import struct
+import sys
+import uuid
+from array import array
+
+from ledger import TradeLedger
+from portfolio import Portfolio
+
+JOURNAL_SUFFIX = '.journal'
+# binary sidecar with the state as of a snapshot record (all but the trades), so loading only replays
+# what came after it
+CHECKPOINT_SUFFIX = '.ckpt'
+# append-only binary sidecar with the trades a checkpoint covers, in the order they were made
+SEGMENT_SUFFIX = '.trades'
+_SEGMENT_HEADER = struct.Struct('<8s16s8x')  # magic, segment id
+_SEGMENT_MAGIC = b'TRADES01'
+_ROW = struct.Struct('<qdddd')  # symbol id, amount, share price, fee, epoch time
+
+# when to fsync appended records: every record, every `fsync_every` records, or leave it to the OS
+FSYNC_POLICIES = ('always', 'batch', 'never')
+
+
+class TradeJournal:
+    """Append-only profile file, one json record per line.
+
+    'trade' records are the trade history, 'cash' and 'fee' records are balance deposits/withdrawals and
+    fee changes, and 'snapshot' records hold the balance/owned/fee state at that point. A snapshot is
+    appended every `snapshot_every` records (and on close); with it the trades made since the last one
+    are appended to the <journal>.trades sidecar (fixed width binary rows) and the rest of the state
+    (balance, owned, symbols, portfolio) is pickled into the small <journal>.ckpt sidecar, which names
+    the snapshot and the number of .trades rows it belongs to. Loading reads those back and replays
+    only the records after the snapshot. Saving after a trade costs one appended line and a snapshot
+    costs the trades since the previous one, however long the history is. A torn last line (crash in
+    the middle of a write) is dropped on load.
+
+    create() and compact() write the trades into the sidecars only: the journal then starts with a
+    'base' snapshot and can't be loaded without them.
+    """
+
+    def __init__(self, path, trader=None, fsync='batch', fsync_every=32, snapshot_every=500):
+        assert fsync in FSYNC_POLICIES, f"fsync must be one of {FSYNC_POLICIES}"
+        self.path = os.path.abspath(path)
+        self.trader = trader
+        self.fsync = fsync
+        self.fsync_every = fsync_every
+        self.snapshot_every = snapshot_every
+        self._unsynced = 0
+        self._since_snapshot = 0
+        self._segment = None  # (id, rows) of the .trades sidecar as of the last checkpoint
+        self._pending = []  # (name, amount, share price, fee, time) of the trades made since
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    @classmethod
+    def create(cls, path, trader, **kwargs):
+        """Write a fresh journal for `trader` (a base snapshot, the history goes into the sidecar) and attach it."""
+        record = _snapshot_record(trader, base=True)
+        line = _dumps(record).encode('utf-8')
+        segment_tmp, segment = _write_segment(path, trader.trades)
+        checkpoint_tmp = _write_checkpoint(path, trader, record['id'], 0, len(line), segment)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        # a crash from here on leaves the new journal with new sidecars still under their .tmp names,
+        # which loading looks for too
+        os.replace(segment_tmp, path + SEGMENT_SUFFIX)
+        os.replace(checkpoint_tmp, path + CHECKPOINT_SUFFIX)
+        journal = cls(path, trader, **kwargs)
+        journal._segment = segment
+        return journal
+
+    def append(self, kind, **fields):
+        if kind == 'trade':
+            record = _trade_record(fields['trade'], fields['fee'])
+            if self.trader is not None:
+                self._pending.append((record['s'], record['a'], record['p'], record['f'], record['t']))
+        else:
+            record = dict(k=kind, **fields)
+        self._write(record)
+        self._since_snapshot += 1
+        if self.trader is not None and self._since_snapshot >= self.snapshot_every:
+            self.snapshot()
+
+    def snapshot(self):
+        record = _snapshot_record(self.trader)
+        self._write(record)
+        # the snapshot line has to be on disk before a sidecar points at it
+        self.sync()
+        end = os.fstat(self._file.fileno()).st_size
+        start = end - len(_dumps(record).encode('utf-8'))
+        if self._segment is None:
+            # not loaded from (or created with) sidecars: they start out with the whole ledger, once
+            segment_tmp, self._segment = _write_segment(self.path, self.trader.trades)
+            os.replace(segment_tmp, self.path + SEGMENT_SUFFIX)
+        else:
+            # rows past what the current checkpoint counts are ignored until the new checkpoint is in place
+            self._segment = _append_segment(self.path, self._segment, self.trader.trades, self._pending)
+        self._pending = []
+        os.replace(_write_checkpoint(self.path, self.trader, record['id'], start, end, self._segment),
+                   self.path + CHECKPOINT_SUFFIX)
+        self._since_snapshot = 0
+
+    def compact(self):
+        """Rewrite the file as one base snapshot (trades go into a fresh .trades), dropping every other record."""
+        self._file.close()
+        compacted = TradeJournal.create(self.path, self.trader, fsync=self.fsync, fsync_every=self.fsync_every,
+                                        snapshot_every=self.snapshot_every)
+        self._file = compacted._file
+        self._segment = compacted._segment
+        self._pending = []
+        self._unsynced = 0
+        self._since_snapshot = 0
+
+    def sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def close(self):
+        if not self._file.closed:
+            if self.trader is not None and self._since_snapshot:
+                # so the next load starts from here
+                self.snapshot()
+            self.sync()
+            self._file.close()
+
+    def _write(self, record):
+        self._file.write(_dumps(record))
+        self._unsynced += 1
+        if self.fsync == 'always' or (self.fsync == 'batch' and self._unsynced >= self.fsync_every):
+            self.sync()
+        else:
+            self._file.flush()
+
+
+def _dumps(record):
+    return json.dumps(record, separators=(',', ':')) + '\n'
+
+
+def _trade_record(trade, fee):
+    return {'k': 'trade', 's': trade.name, 'a': trade.amount, 'p': trade.share_value, 'f': fee,
+            't': trade.purchase_time.timestamp()}
+
+
+def _snapshot_record(trader, base=False):
+    record = {'k': 'snapshot', 'id': uuid.uuid4().hex, 'n': len(trader.trades), 'username': trader.username,
+              'fee': trader.fee, 'balance': trader.balance, 'owned': trader.owned,
+              'cost_basis': trader.portfolio.method}
+    if base:
+        record['base'] = True
+    return record
+
+
+def _segment_rows(ledger, rows):
+    """The fixed width bytes of `rows`, (name, amount, share price, fee, time) tuples."""
+    return b''.join(_ROW.pack(ledger.symbol_id(name), amount, price, fee, when)
+                    for name, amount, price, fee, when in rows)
+
+
+def _write_segment(path, ledger):
+    """Write the whole ledger as a new .trades sidecar; returns (temp file, (segment id, rows))."""
+    tmp_path = path + SEGMENT_SUFFIX + '.tmp'
+    segment_id = uuid.uuid4().bytes
+    # interleave the columns into rows without a per-row python loop
+    rows = array('d', bytes(_ROW.size * len(ledger)))
+    rows[0::5] = array('d', ledger.column('symbol').tobytes())  # the ids' bytes, as they are
+    for i, name in enumerate(('amount', 'share_value', 'fee', 'timestamp'), 1):
+        rows[i::5] = ledger.column(name)
+    with open(tmp_path, 'wb') as f:
+        f.write(_SEGMENT_HEADER.pack(_SEGMENT_MAGIC, segment_id))
+        f.write(_little_endian(rows))
+        f.flush()
+        os.fsync(f.fileno())
+    return tmp_path, (segment_id, len(ledger))
+
+
+def _append_segment(path, segment, ledger, pending):
+    """Write the `pending` trades after the rows `segment` counts; returns the new (segment id, rows)."""
+    segment_id, count = segment
+    with open(path + SEGMENT_SUFFIX, 'r+b') as f:
+        f.seek(_SEGMENT_HEADER.size + count * _ROW.size)
+        f.write(_segment_rows(ledger, pending))
+        f.truncate()
+        f.flush()
+        os.fsync(f.fileno())
+    return segment_id, count + len(pending)
+
+
+def _read_segment(path, segment_id, count, symbols):
+    """TradeLedger over the first `count` rows of the .trades sidecar (or its .tmp) with id `segment_id`;
+    returns (ledger, file it came from)."""
+    for candidate in (path + SEGMENT_SUFFIX, path + SEGMENT_SUFFIX + '.tmp'):
+        try:
+            with open(candidate, 'rb') as f:
+                header = f.read(_SEGMENT_HEADER.size)
+                data = f.read(count * _ROW.size)
+        except OSError:
+            continue
+        if len(header) != _SEGMENT_HEADER.size or _SEGMENT_HEADER.unpack(header) != (_SEGMENT_MAGIC, segment_id) \
+                or len(data) != count * _ROW.size:
+            continue
+        ids, values = array('q'), array('d')
+        ids.frombytes(data)
+        values.frombytes(data)
+        if sys.byteorder != 'little':
+            ids.byteswap()
+            values.byteswap()
+        columns = [ids[0::5]] + [values[i::5] for i in range(1, 5)]
+        return TradeLedger.from_columns(symbols, *columns), candidate
+    raise ValueError(f"no {SEGMENT_SUFFIX} file matches {path + CHECKPOINT_SUFFIX}")
+
+
+def _little_endian(column):
+    if sys.byteorder == 'little':
+        return column.tobytes()
+    swapped = array(column.typecode, column)
+    swapped.byteswap()
+    return swapped.tobytes()
+
+
+def _write_checkpoint(path, trader, snapshot_id, start, end, segment):
+    """Pickle the trader's state (but the trades) as of the snapshot line at [start, end) of the journal and
+    `segment` (id, rows) of the .trades sidecar; returns the temp file."""
+    tmp_path = path + CHECKPOINT_SUFFIX + '.tmp'
+    segment_id, rows = segment
+    state = {'id': snapshot_id, 'start': start, 'end': end, 'segment': segment_id, 'rows': rows,
+             'symbols': list(trader.trades.symbols), 'username': trader.username, 'fee': trader.fee,
+             'balance': trader.balance, 'owned': trader.owned, 'portfolio': trader.portfolio}
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    return tmp_path
+
+
+def restore_checkpoint(path, trader):
+    """Load the journal's sidecars into `trader` if they match the journal.
+
+    Returns (the offset to replay from, the (id, rows) of the .trades sidecar), or (0, None).
+    """
+    checkpoint = path + CHECKPOINT_SUFFIX
+    for candidate in (checkpoint, checkpoint + '.tmp'):
+        try:
+            with open(candidate, 'rb') as f:
+                state = pickle.load(f)
+            with open(path, 'rb') as f:
+                f.seek(state['start'])
+                line = f.read(state['end'] - state['start'])
+            if not line.endswith(b'\n') or json.loads(line).get('id') != state['id']:
+                continue
+            trades, segment_path = _read_segment(path, state['segment'], state['rows'], state['symbols'])
+        except (OSError, ValueError, KeyError, EOFError, pickle.UnpicklingError):
+            continue
+        if segment_path != path + SEGMENT_SUFFIX:
+            os.replace(segment_path, path + SEGMENT_SUFFIX)
+        if candidate != checkpoint:
+            os.replace(candidate, checkpoint)
+        trader.username = state['username']
+        trader.fee = state['fee']
+        trader.balance = state['balance']
+        trader.owned = dict(state['owned'])
+        trader.trades = trades
+        trader.portfolio = state['portfolio']
+        return state['end'], (state['segment'], state['rows'])
+    return 0, None
+
+
+def replay(path, trader, start=0, trades=None):
+    """Apply the records of the journal at `path` from byte `start` on to `trader`; returns the byte length
+    of the valid part. The trades applied are also appended to the `trades` list, if given."""
+    valid = start
+    with open(path, 'rb') as f:
+        f.seek(start)
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break  # torn write, everything from here on is garbage
+            if not line.endswith(b'\n'):
+                break
+            valid += len(line)
+            kind = record['k']
+            if kind == 'trade':
+                name, amount = record['s'], record['a']
+                trader.trades.add(name, amount, record['p'], record['f'], record['t'])
+                trader.portfolio.apply(name, amount, record['p'], record['f'])
+                trader.owned[name] = trader.owned.get(name, 0) + amount
+                trader.balance -= amount * record['p'] + record['f']
+                if trades is not None:
+                    trades.append((name, amount, record['p'], record['f'], record['t']))
+            elif kind == 'cash':
+                trader.balance += record['value']
+            elif kind == 'fee':
+                trader.fee = record['value']
+            elif kind == 'snapshot':
+                if record.get('base') and valid - len(line) == start == 0:
+                    raise ValueError(f"{path} keeps its trade history in {path + SEGMENT_SUFFIX} and "
+                                     f"{path + CHECKPOINT_SUFFIX}, which are missing or don't match it")
+                trader.username = record['username']
+                trader.fee = record['fee']
+                trader.balance = record['balance']
+                trader.owned = dict(record['owned'])
+                if record.get('cost_basis', trader.portfolio.method) != trader.portfolio.method:
+                    trader.portfolio = Portfolio.from_ledger(trader.trades, record['cost_basis'])
+    return valid
+
+
+def load_journaled_trader(path, **kwargs):
+    from Trader import Trader
+    trader = Trader(os.path.splitext(os.path.basename(path))[0])
+    start, segment = restore_checkpoint(path, trader)
+    replayed = []
+    valid = replay(path, trader, start, replayed)
+    if valid != os.path.getsize(path):
+        # drop the torn tail so new records don't get appended after garbage
+        with open(path, 'r+b') as f:
+            f.truncate(valid)
+    trader.journal = TradeJournal(path, trader, **kwargs)
+    if segment is not None:
+        # the next snapshot appends the replayed trades to the .trades sidecar
+        trader.journal._segment = segment
+        trader.journal._pending = replayed
+    return trader
+
+
+def store_journaled_trader(trader, path, **kwargs):
+    journal = trader.journal
+    if journal is not None and journal.path == os.path.abspath(path):
+        journal.sync()
+        return
+    if journal is not None:
+        journal.close()
+    trader.journal = TradeJournal.create(path, trader, **kwargs)
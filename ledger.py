@@ -0,0 +1,170 @@
+import datetime
+import operator
+from array import array
+from bisect import bisect_left, bisect_right
+
+from Stock import Stock
+
+
+def _epoch(when):
+    if when is None or isinstance(when, (int, float)):
+        return when
+    return when.timestamp()
+
+
+class TradeLedger:
+    """Trade history as parallel arrays (symbol id, signed amount, share price, fee, epoch time).
+
+    Rows are kept sorted by time, so date range queries are a bisect plus a walk over the matching rows.
+    It behaves like the list of Stock objects it replaces: len(), indexing and iteration give Stock
+    objects, built on demand.
+    """
+
+    def __init__(self, trades=()):
+        self.symbols = []
+        self._symbol_ids = dict()
+        self._symbol = array('q')
+        self._amount = array('d')
+        self._price = array('d')
+        self._fee = array('d')
+        self._time = array('d')
+        for trade in trades:
+            self.append(trade)
+
+    @classmethod
+    def from_columns(cls, symbols, symbol, amount, share_value, fee, timestamp):
+        """A ledger over ready made columns (array('q') ids into `symbols`, array('d') for the rest).
+
+        Rows are taken in the order they were added; rows out of time order end up where add() would
+        have put them.
+        """
+        ledger = cls()
+        ledger.symbols = list(symbols)
+        ledger._symbol_ids = {name: i for i, name in enumerate(ledger.symbols)}
+        columns = (symbol, amount, share_value, fee, timestamp)
+        if not all(map(operator.le, timestamp, timestamp[1:])):
+            # a stable sort by time, as inserting each at bisect_right does
+            order = sorted(range(len(timestamp)), key=timestamp.__getitem__)
+            columns = tuple(array(column.typecode, map(column.__getitem__, order)) for column in columns)
+        ledger._symbol, ledger._amount, ledger._price, ledger._fee, ledger._time = columns
+        return ledger
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_symbol_ids']  # derived from symbols
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._symbol_ids = {name: i for i, name in enumerate(self.symbols)}
+
+    def symbol_id(self, name):
+        symbol_id = self._symbol_ids.get(name)
+        if symbol_id is None:
+            symbol_id = self._symbol_ids[name] = len(self.symbols)
+            self.symbols.append(name)
+        return symbol_id
+
+    def append(self, trade: Stock, fee: float = 0):
+        self.add(trade.name, trade.amount, trade.share_value, fee, trade.purchase_time.timestamp())
+
+    def add(self, name, amount, share_value, fee, timestamp):
+        row = (self.symbol_id(name), amount, share_value, fee, timestamp)
+        columns = (self._symbol, self._amount, self._price, self._fee, self._time)
+        if not self._time or timestamp >= self._time[-1]:
+            for column, value in zip(columns, row):
+                column.append(value)
+        else:
+            # out of order (e.g. a backdated import), keep the time order
+            i = bisect_right(self._time, timestamp)
+            for column, value in zip(columns, row):
+                column.insert(i, value)
+
+    def __len__(self):
+        return len(self._time)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return Stock(self.name(i), self._amount[i], self._price[i],
+                     datetime.datetime.fromtimestamp(self._time[i]))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def name(self, i):
+        return self.symbols[self._symbol[i]]
+
+    def amount(self, i):
+        return self._amount[i]
+
+    def share_value(self, i):
+        return self._price[i]
+
+    def fee(self, i):
+        return self._fee[i]
+
+    def timestamp(self, i):
+        return self._time[i]
+
+    def column(self, name):
+        """The raw array behind one column ('symbol', 'amount', 'share_value', 'fee' or 'timestamp').
+
+        Symbol ids index into `symbols`. numpy.frombuffer can wrap these without copying.
+        """
+        return {'symbol': self._symbol, 'amount': self._amount, 'share_value': self._price,
+                'fee': self._fee, 'timestamp': self._time}[name]
+
+    def records(self, start=None, end=None):
+        """(name, amount, share_value, fee, timestamp) tuples for the trades in [start, end)."""
+        lo, hi = self.bounds(start, end)
+        for i in range(lo, hi):
+            yield self.symbols[self._symbol[i]], self._amount[i], self._price[i], self._fee[i], self._time[i]
+
+    def bounds(self, start=None, end=None):
+        """Row bounds [lo, hi) of the trades made in [start, end); both are datetimes, epochs or None."""
+        start, end = _epoch(start), _epoch(end)
+        lo = 0 if start is None else bisect_left(self._time, start)
+        hi = len(self._time) if end is None else bisect_left(self._time, end, lo)
+        return lo, hi
+
+    def rows(self, start=None, end=None, symbols=None):
+        """Row numbers of the trades made in [start, end), optionally only for the given symbol names."""
+        lo, hi = self.bounds(start, end)
+        if symbols is None:
+            return range(lo, hi)
+        symbol_ids = {self._symbol_ids[name] for name in symbols if name in self._symbol_ids}
+        return [i for i in range(lo, hi) if self._symbol[i] in symbol_ids]
+
+    def _rows(self, start, end, symbol):
+        lo, hi = self.bounds(start, end)
+        if symbol is None:
+            return range(lo, hi)
+        symbol_id = self._symbol_ids.get(symbol)
+        return [i for i in range(lo, hi) if self._symbol[i] == symbol_id]
+
+    def revenue(self, start=None, end=None, symbol=None):
+        # signed: buys count positive, sells negative (what Trader.get_revenue_from always returned)
+        amount, price = self._amount, self._price
+        return sum(amount[i] * price[i] for i in self._rows(start, end, symbol))
+
+    def proceeds(self, start=None, end=None, symbol=None):
+        # money taken in by sells
+        amount, price = self._amount, self._price
+        return sum(-amount[i] * price[i] for i in self._rows(start, end, symbol) if amount[i] < 0)
+
+    def volume(self, start=None, end=None, symbol=None):
+        amount = self._amount
+        return sum(abs(amount[i]) for i in self._rows(start, end, symbol))
+
+    def fees(self, start=None, end=None, symbol=None):
+        fee = self._fee
+        return sum(fee[i] for i in self._rows(start, end, symbol))
+
+    def pnl(self, prices, start=None, end=None, symbol=None):
+        """P&L of the trades made in [start, end), with what they bought/sold marked at `prices`, after fees."""
+        total = 0
+        for i in self._rows(start, end, symbol):
+            total += self._amount[i] * (prices[self.symbols[self._symbol[i]]] - self._price[i]) - self._fee[i]
+        return total
@@ -1,17 +1,31 @@
+import os
 import sys
-from functools import wraps
+import time
+from functools import partial, wraps
+
+# taken before the Qt imports, so the startup timing includes them
+STARTED = time.perf_counter()
 
-import yfinance
 from PyQt5 import QtWidgets
-from PyQt5.QtCore import QRegExp
+from PyQt5.QtCore import QRegExp, QStringListModel, Qt, QTimer
 from PyQt5.QtGui import QRegExpValidator
 from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QPushButton, QTabWidget, QLineEdit, QLabel, \
-    QGridLayout, QMessageBox, QFileDialog, QInputDialog, QTableWidget, QTableWidgetItem, QHBoxLayout, QCompleter
+    QGridLayout, QMessageBox, QFileDialog, QInputDialog, QTableView, QHBoxLayout, QCompleter
 
+import metrics
+from history_model import TradeHistoryModel
+from profile_store import SQLITE_SUFFIXES, ProfileStore
 from Trader import Trader, load_trader_from_file, store_trader_in_file
+from workers import JobRunner
 
 WIDTH = 800
 HEIGHT = 340
+# the buy completer only ever holds this many suggestions
+COMPLETER_LIMIT = 50
+# streamed net worth is redrawn at most this often, however many ticks arrive
+LIVE_REFRESH_MS = 100
+# --startup-time fails when the first window takes longer than this to come up
+STARTUP_TARGET_MS = 1000
 
 
 # TODO:
@@ -22,29 +36,39 @@ HEIGHT = 340
 # - create settings for user to allow overwriting current profile on exit (etc)
 
 
+def load_ticker_index():
+    # memory mapped, the csv is only parsed again when it changes
+    with metrics.span('startup.tickers'):
+        from tickers import TickerIndex
+        return TickerIndex.load(with_dots=False)
+
+
 def update_gui_info(func):
     @wraps(func)
     def wrapper(self, *args, **kwargs):
         result = func(self, *args, **kwargs)
-        self.update_finance()
-        self.update_trades()
-        self.update_available_stocks()
+        # the refresh itself runs in the background (after any order the call queued)
+        self.refresh()
         return result
 
     return wrapper
 
 
 class MainWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, ask_profile=True):
         super().__init__()
-        # load ticker list
-        from concur import get_tickers_from_csv
-        self.stored_tickers = get_tickers_from_csv(False)
+        # filled in by a background job, the buy completer stays empty until then
+        self.stored_tickers = None
 
         self.stock_name_input = None
         self.trader = None
+        self.jobs = JobRunner(self)
+        self.live = None
+        self.live_version = None
         self.initUI()
-        self.select_profile()
+        self.jobs.submit_background(load_ticker_index, on_done=self.tickers_loaded, on_error=self.show_error)
+        if ask_profile:
+            self.select_profile()
 
     def initUI(self):
         self.setGeometry(100, 100, WIDTH, HEIGHT)
@@ -130,6 +154,10 @@ class MainWindow(QMainWindow):
                                                "Do you want to save your profile before closing?")
             if save_choice == QMessageBox.Yes:
                 self.save_profile()
+        # let queued orders and saves finish before the process goes away
+        self.jobs.wait_for_done()
+        if self.trader and self.trader.journal is not None:
+            self.trader.journal.close()
 
         event.accept()
 
@@ -178,7 +206,11 @@ class MainWindow(QMainWindow):
         buy_layout.addWidget(stock_name_label, 1, 0)
         self.stock_name_input = QLineEdit()
         self.stock_name_input.setPlaceholderText("Enter stock symbol or select from list")
-        self.stock_name_input.setCompleter(QCompleter(self.fetch_stocks()))
+        self.stock_completions = QStringListModel()
+        stock_completer = QCompleter(self.stock_completions, self)
+        stock_completer.setCaseSensitivity(Qt.CaseInsensitive)
+        self.stock_name_input.setCompleter(stock_completer)
+        self.stock_name_input.textEdited.connect(self.update_stock_completions)
         buy_layout.addWidget(self.stock_name_input, 1, 1)
 
         amount_label = QLabel("Amount:")
@@ -223,7 +255,8 @@ class MainWindow(QMainWindow):
         sell_layout.addWidget(stock_name_label, 1, 0)
         self.sell_stock_name_input = QLineEdit()
         self.sell_stock_name_input.setPlaceholderText("Enter stock symbol or select from list")
-        self.sell_stock_name_input.setCompleter(QCompleter(self.fetch_owned_stocks()))
+        # filled in from the owned copy each refresh brings back from the job thread
+        self.sell_stock_name_input.setCompleter(QCompleter([]))
 
         sell_layout.addWidget(self.sell_stock_name_input, 1, 1)
 
@@ -299,8 +332,18 @@ class MainWindow(QMainWindow):
         history_layout = QVBoxLayout()
         history_tab.setLayout(history_layout)
 
-        self.trade_history = QTableWidget()
-        self.trade_history.setColumnCount(4)
+        history_filter = QLineEdit()
+        history_filter.setPlaceholderText("Filter by stock symbol")
+        history_layout.addWidget(history_filter)
+
+        # the view only asks the model for the rows that are on screen
+        self.trade_history_model = TradeHistoryModel(parent=self)
+        history_filter.textChanged.connect(self.trade_history_model.set_filter)
+        self.trade_history = QTableView()
+        self.trade_history.setModel(self.trade_history_model)
+        self.trade_history.setSortingEnabled(True)
+        self.trade_history.sortByColumn(3, Qt.AscendingOrder)
+        self.trade_history.verticalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Fixed)
 
         self.trade_history.horizontalHeader().setSectionResizeMode(0, QtWidgets.QHeaderView.Interactive)
         self.trade_history.horizontalHeader().setSectionResizeMode(1, QtWidgets.QHeaderView.Interactive)
@@ -311,22 +354,37 @@ class MainWindow(QMainWindow):
         return history_tab
 
     # ... (rest of the methods remain the same)
-    @update_gui_info
     def load_profile(self):
-        filename, _ = QFileDialog.getOpenFileName(self, "Load Profile", "", "Pickle Files (*.pickle)")
+        filename, _ = QFileDialog.getOpenFileName(self, "Load Profile", "",
+                                                  "Profiles (*.journal *.pickle *.db);;Journal Files (*.journal);;"
+                                                  "Pickle Files (*.pickle);;Profile Databases (*.db)")
         if filename:
-            try:
-                old = self.trader
-                self.trader = load_trader_from_file(filename)
-                self.statusBar().showMessage(f"Loaded profile from {filename}")
-                if old is None:
-                    self.showNormal()
-                    self.activateWindow()
-
-            except Exception as e:
-                QMessageBox.critical(self, "Error", str(e))
-                self.select_profile()
+            username = None
+            if filename.endswith(SQLITE_SUFFIXES):
+                with ProfileStore(filename) as store:
+                    usernames = store.usernames()
+                username, ok = QInputDialog.getItem(self, "Load Profile", "Profile:", usernames, editable=False)
+                if not ok:
+                    return
+            self.statusBar().showMessage(f"Loading profile from {filename}...")
+            self.jobs.submit(load_trader_from_file, filename, username,
+                             on_done=lambda trader: self.profile_loaded(trader, filename),
+                             on_error=self.profile_load_failed)
+
+    def profile_loaded(self, trader, filename):
+        old = self.trader
+        self.trader = trader
+        self.statusBar().showMessage(f"Loaded profile from {filename}")
+        if old is None:
+            self.showNormal()
+            self.activateWindow()
+        self.refresh()
+
+    def profile_load_failed(self, e):
+        QMessageBox.critical(self, "Error", str(e))
+        self.select_profile()
 
+    @update_gui_info
     def new_profile(self):
         username, ok = QInputDialog.getText(self, "New Profile", "Enter username:")
         if ok:
@@ -342,13 +400,13 @@ class MainWindow(QMainWindow):
 
     def save_profile(self):
         if self.trader:
-            filename, _ = QFileDialog.getSaveFileName(self, "Save Profile", "", "Pickle Files (*.pickle)")
+            filename, _ = QFileDialog.getSaveFileName(self, "Save Profile", "",
+                                                      "Journal Files (*.journal);;Pickle Files (*.pickle);;"
+                                                      "Profile Databases (*.db)")
             if filename:
-                try:
-                    store_trader_in_file(self.trader, filename)
-                    self.statusBar().showMessage(f"Saved profile to {filename}")
-                except Exception as e:
-                    QMessageBox.critical(self, "Error", str(e))
+                self.jobs.submit(store_trader_in_file, self.trader, filename,
+                                 on_done=lambda _: self.statusBar().showMessage(f"Saved profile to {filename}"),
+                                 on_error=self.show_error)
         else:
             QMessageBox.warning(self, "Warning", "No active profile to save.")
 
@@ -359,13 +417,16 @@ class MainWindow(QMainWindow):
             try:
                 if by_cost:
                     cost = float(self.cost_input.text())
-                    self.trader.buy(stock_name, cost)
+                    order = self.trader.buy, stock_name, cost
                 else:
                     amount = float(self.amount_input.text())
-                    self.trader.buy_shares(stock_name, amount)
-                self.statusBar().showMessage(f"Bought {stock_name}")
+                    order = self.trader.buy_shares, stock_name, amount
             except Exception as e:
                 QMessageBox.critical(self, "Error", str(e))
+                return
+            self.statusBar().showMessage(f"Buying {stock_name}...")
+            self.jobs.submit(*order, on_done=lambda _: self.statusBar().showMessage(f"Bought {stock_name}"),
+                             on_error=self.show_error)
         else:
             QMessageBox.warning(self, "Warning", "No active profile.")
 
@@ -375,89 +436,141 @@ class MainWindow(QMainWindow):
             stock_name = self.sell_stock_name_input.text()
             try:
                 if by_cost:
-                    value = float(self.sell_cost_input.text())
-                    self.trader.sell(stock_name, value=value)
+                    kwargs = dict(value=float(self.sell_cost_input.text()))
                 else:
-                    amount = float(self.sell_amount_input.text())
-                    self.trader.sell(stock_name, amount=amount)
-                self.statusBar().showMessage(f"Sold {stock_name}")
+                    kwargs = dict(amount=float(self.sell_amount_input.text()))
             except Exception as e:
                 QMessageBox.critical(self, "Error", str(e))
+                return
+            self.statusBar().showMessage(f"Selling {stock_name}...")
+            self.jobs.submit(self.trader.sell, stock_name, **kwargs,
+                             on_done=lambda _: self.statusBar().showMessage(f"Sold {stock_name}"),
+                             on_error=self.show_error)
         else:
             QMessageBox.warning(self, "Warning", "No active profile.")
 
     @update_gui_info
     def add_money(self, amount):
         if self.trader:
-            try:
-                self.trader.add_money(amount)
-                self.statusBar().showMessage(f"Added ${amount:.2f} to account.")
-            except Exception as e:
-                QMessageBox.critical(self, "Error", str(e))
+            # queued behind any running order, so the balance is never updated from two threads
+            self.jobs.submit(self.trader.add_money, amount,
+                             on_done=lambda _: self.statusBar().showMessage(f"Added ${amount:.2f} to account."),
+                             on_error=self.show_error)
         else:
             QMessageBox.warning(self, "Warning", "No active profile.")
 
     def set_trading_fee(self, fee_percent):
         if self.trader:
-            try:
-                self.trader.set_fee(fee_percent / 100)  # Convert percentage to decimal
-                self.statusBar().showMessage(f"Set trading fee to {fee_percent}%")
-            except Exception as e:
-                QMessageBox.critical(self, "Error", str(e))
+            # on the job thread too: set_fee writes to the journal, which fills write to from there
+            self.jobs.submit(self.trader.set_fee, fee_percent / 100,  # Convert percentage to decimal
+                             on_done=lambda _: self.statusBar().showMessage(f"Set trading fee to {fee_percent}%"),
+                             on_error=self.show_error)
         else:
             QMessageBox.warning(self, "Warning", "No active profile.")
 
-    def update_finance(self):
-        if self.trader:
-            try:
-                balance = self.trader.balance
-                self.balance_label.setText(f"Balance: ${balance:.2f}")
-                stock_value = 0
-                for stock_name, amount in self.trader.owned.items():
-                    price = float(yfinance.Ticker(stock_name).get_info()['currentPrice'])
-                    stock_value += price * amount
-                revenue = 0
-                for trade in self.trader.trades:
-                    if trade.amount < 0:
-                        revenue -= trade.amount * trade.share_value
-                net_worth = balance + stock_value
-                self.net_worth_label.setText(f"Net worth: ${net_worth:.2f}")
-                self.revenue_label.setText(f"Revenue : ${revenue:.2f}")
+    def show_error(self, e):
+        QMessageBox.critical(self, "Error", str(e))
 
-            except Exception as e:
-                QMessageBox.critical(self, "Error", str(e))
+    def refresh(self):
+        # runs on the job thread, so it never races an order on the same trader
+        if self.trader:
+            self.jobs.submit_refresh(partial(self.compute_finance, self.trader),
+                                     on_done=self.refresh_done, on_error=self.show_error)
+
+    @staticmethod
+    def compute_finance(trader):
+        with metrics.span('gui.compute_finance'):
+            # owned is copied here, on the job thread, for the live view to resync from
+            return trader.mark_to_market(), trader.portfolio.proceeds, dict(trader.owned)
+
+    def refresh_done(self, finance):
+        with metrics.span('gui.update_finance'):
+            self.update_finance(*finance)
+        with metrics.span('gui.update_trades'):
+            self.update_trades()
+        with metrics.span('gui.update_available_stocks'):
+            self.update_available_stocks(finance[2])
+
+    def start_live_quotes(self, stream):
+        # ticks only touch self.live (O(1) each); the timer redraws the label if anything changed
+        from streaming import LivePortfolio
+        self.live = LivePortfolio(stream)
+        timer = QTimer(self)
+        timer.timeout.connect(self.update_live_net_worth)
+        timer.start(LIVE_REFRESH_MS)
+
+    def update_live_net_worth(self):
+        if self.live is not None and self.live.version != self.live_version:
+            self.live_version = self.live.version
+            self.net_worth_label.setText(f"Net worth: ${self.live.net_worth:.2f}")
+
+    def update_finance(self, valuation, revenue, owned):
+        if self.live is not None:
+            self.live.resync(valuation.balance, owned, valuation.prices)
+        self.balance_label.setText(f"Balance: ${valuation.balance:.2f}")
+        self.net_worth_label.setText(f"Net worth: ${valuation.net_worth:.2f}")
+        self.revenue_label.setText(f"Revenue : ${revenue:.2f}")
+        if valuation.missing:
+            self.statusBar().showMessage(f"Could not get prices for: {', '.join(valuation.missing)}")
 
     def update_trades(self):
-        self.trade_history.clear()
-        self.trade_history.setHorizontalHeaderItem(0, QTableWidgetItem("Stock name"))
-        self.trade_history.setHorizontalHeaderItem(1, QTableWidgetItem("Amount"))
-        self.trade_history.setHorizontalHeaderItem(2, QTableWidgetItem("Share value"))
-        self.trade_history.setHorizontalHeaderItem(3, QTableWidgetItem("Purchase time"))
-        if self.trader:
-            try:
-                trades = self.trader.trades
-                self.trade_history.setRowCount(len(trades))
-                for idx, elem in enumerate(trades):
-                    self.trade_history.setItem(idx, 0, QTableWidgetItem(elem.name))
-                    self.trade_history.setItem(idx, 1, QTableWidgetItem(f"{elem.amount:g}"))
-                    self.trade_history.setItem(idx, 2, QTableWidgetItem(f"{elem.share_value:g}"))
-                    self.trade_history.setItem(idx, 3, QTableWidgetItem(f"{elem.purchase_time}"))
-            except Exception as e:
-                QMessageBox.critical(self, "Error", str(e))
+        ledger = self.trader.trades if self.trader else None
+        if self.trade_history_model.ledger is not ledger:
+            self.trade_history_model.set_ledger(ledger)
+        else:
+            # only the fills made since the last refresh are added to the view
+            self.trade_history_model.sync()
 
-    def update_available_stocks(self):
-        self.sell_stock_name_input.setCompleter(QCompleter(self.fetch_owned_stocks()))
+    def update_available_stocks(self, owned):
+        self.sell_stock_name_input.setCompleter(QCompleter(list(owned)))
 
-    def fetch_stocks(self):
-        return self.stored_tickers
+    def update_stock_completions(self, text):
+        self.stock_completions.setStringList(self.fetch_stocks(text.upper()))
 
-    def fetch_owned_stocks(self):
-        if self.trader:
-            return self.trader.owned.keys()
-        return None
+    def tickers_loaded(self, index):
+        self.stored_tickers = index
+        if self.stock_name_input is not None and self.stock_name_input.text():
+            self.update_stock_completions(self.stock_name_input.text())
+
+    def fetch_stocks(self, prefix=''):
+        # prefix search on the ticker index instead of handing the completer the whole universe
+        if not prefix or self.stored_tickers is None:
+            return []
+        return self.stored_tickers.prefix(prefix, COMPLETER_LIMIT)
+
+
+def report_startup_time(window, target_ms=STARTUP_TARGET_MS):
+    """Called on the first event loop turn after the window is shown: print the time since launch and quit."""
+    elapsed_ms = (time.perf_counter() - STARTED) * 1000
+    if metrics.enabled():
+        # a timing (count/sum/max per run), not a counter that adds up across runs
+        metrics.registry().observe('startup.first_window', elapsed_ms / 1000)
+    print(f"first window after {elapsed_ms:.0f}ms (target {target_ms}ms)")
+    window.jobs.wait_for_done()
+    QApplication.instance().exit(0 if elapsed_ms <= target_ms else 1)
 
 
 if __name__ == "__main__":
+    # TRADINGSIM_METRICS=<file.jsonl> records spans/counters, TRADINGSIM_PROFILE=<file.prof> runs under cProfile
+    if os.environ.get('TRADINGSIM_METRICS'):
+        metrics.enable(metrics.JsonLinesSink(os.environ['TRADINGSIM_METRICS']))
     app = QApplication(sys.argv)
+    if '--startup-time' in sys.argv or os.environ.get('TRADINGSIM_STARTUP_TIMING'):
+        # time to first window, without the profile dialog (which would be waiting on the user)
+        window = MainWindow(ask_profile=False)
+        window.showNormal()
+        QTimer.singleShot(0, partial(report_startup_time, window))
+        sys.exit(app.exec_())
+    if os.environ.get('TRADINGSIM_PROFILE'):
+        with metrics.profiled(os.environ['TRADINGSIM_PROFILE']):
+            window = MainWindow()
+            code = app.exec_()
+        sys.exit(code)
     window = MainWindow()
+    if os.environ.get('TRADINGSIM_SIMULATED_FEED'):
+        # local random-walk ticks for the held symbols, in place of a real streaming feed
+        from streaming import QuoteStream, SimulatedFeed
+        stream = QuoteStream()
+        window.start_live_quotes(stream)
+        SimulatedFeed(stream, rate=float(os.environ['TRADINGSIM_SIMULATED_FEED'])).start()
     sys.exit(app.exec_())
@@ -0,0 +1,183 @@
+"""Timing spans and counters for the hot paths (price fetches, profile I/O, GUI refreshes).
+
+Disabled by default: span() then hands back one shared no-op context manager and incr() returns
+right away, so instrumented code pays about one function call. Enable with a set of sinks:
+
+    metrics.enable(metrics.JsonLinesSink('metrics.jsonl'))
+    with metrics.span('profile.save'):
+        ...
+    print(metrics.registry().prometheus_text())
+"""
+import io
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+_registry = None
+
+
+class Registry:
+    def __init__(self, sinks=()):
+        self.sinks = list(sinks)
+        self.counters = dict()
+        self.timings = dict()  # name -> [count, total seconds, max seconds]
+        self._lock = threading.Lock()
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        for sink in self.sinks:
+            sink.counter(name, value)
+
+    def observe(self, name, seconds):
+        with self._lock:
+            timing = self.timings.get(name)
+            if timing is None:
+                self.timings[name] = [1, seconds, seconds]
+            else:
+                timing[0] += 1
+                timing[1] += seconds
+                timing[2] = max(timing[2], seconds)
+        for sink in self.sinks:
+            sink.span(name, seconds)
+
+    def snapshot(self):
+        with self._lock:
+            return {'counters': dict(self.counters),
+                    'timings': {name: {'count': count, 'total_s': total, 'max_s': longest}
+                                for name, (count, total, longest) in self.timings.items()}}
+
+    def prometheus_text(self):
+        """The registry in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot['counters'].items()):
+            metric = _metric_name(name) + '_total'
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+        for name, timing in sorted(snapshot['timings'].items()):
+            metric = _metric_name(name) + '_seconds'
+            lines += [f"# TYPE {metric} summary", f"{metric}_count {timing['count']}",
+                      f"{metric}_sum {timing['total_s']}", f"{metric}_max {timing['max_s']}"]
+        return '\n'.join(lines) + '\n'
+
+
+def _metric_name(name):
+    return 'tradingsim_' + ''.join(c if c.isalnum() else '_' for c in name)
+
+
+class InMemorySink:
+    """Keeps the most recent `maxlen` events as (kind, name, value, time) tuples."""
+
+    def __init__(self, maxlen=10000):
+        self.events = deque(maxlen=maxlen)
+
+    def counter(self, name, value):
+        self.events.append(('counter', name, value, time.time()))
+
+    def span(self, name, seconds):
+        self.events.append(('span', name, seconds, time.time()))
+
+
+class JsonLinesSink:
+    def __init__(self, path):
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def _write(self, record):
+        line = json.dumps(record) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def counter(self, name, value):
+        self._write({'type': 'counter', 'name': name, 'value': value, 'time': time.time()})
+
+    def span(self, name, seconds):
+        self._write({'type': 'span', 'name': name, 'ms': seconds * 1000, 'time': time.time()})
+
+    def close(self):
+        self._file.close()
+
+
+class _Span:
+    __slots__ = ('registry', 'name', 'start')
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry.observe(self.name, time.perf_counter() - self.start)
+        if exc_type is not None:
+            self.registry.incr(self.name + '.errors')
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def enable(*sinks):
+    global _registry
+    _registry = Registry(sinks)
+    return _registry
+
+
+def disable():
+    global _registry
+    _registry = None
+
+
+def registry():
+    return _registry
+
+
+def enabled():
+    return _registry is not None
+
+
+def span(name):
+    """Context manager timing its block as `name` (errors raised inside are counted as `name`.errors)."""
+    if _registry is None:
+        return _NO_SPAN
+    return _Span(_registry, name)
+
+
+def incr(name, value=1):
+    if _registry is not None:
+        _registry.incr(name, value)
+
+
+@contextmanager
+def profiled(path=None, top=30):
+    """Run the block under cProfile; dump the stats to `path`, or print the `top` entries by cumulative time."""
+    # only imported when profiling is asked for, they are slow to import and unused otherwise
+    import cProfile
+    import pstats
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield profile
+    finally:
+        profile.disable()
+        if path:
+            profile.dump_stats(path)
+        else:
+            out = io.StringIO()
+            pstats.Stats(profile, stream=out).sort_stats('cumulative').print_stats(top)
+            print(out.getvalue())
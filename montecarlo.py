@@ -0,0 +1,207 @@
+import argparse
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+METHODS = ('gbm', 'bootstrap')
+PERCENTILES = (5, 25, 50, 75, 95)
+# net worth is histogrammed as log(value / starting value) over +-LOG_RANGE in BINS bins (~0.35% wide, and
+# interpolated inside); values outside that (or <= 0) land in the first / last bin
+BINS = 4000
+LOG_RANGE = np.log(1000.0)
+
+# `days` are the checkpoints (days from now); bands maps each percentile to the net worth at every checkpoint
+MonteCarloResult = namedtuple('MonteCarloResult', ['days', 'bands', 'mean', 'initial', 'paths', 'missing'])
+
+# set in each worker process by _set_model
+_model = None
+
+
+def _set_model(model):
+    global _model
+    _model = model
+
+
+def _bins(values, initial):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratios = np.log(values / initial)
+    ratios = np.nan_to_num(ratios, nan=-LOG_RANGE, posinf=LOG_RANGE, neginf=-LOG_RANGE)
+    return np.clip(((ratios + LOG_RANGE) / (2 * LOG_RANGE) * BINS).astype(np.intp), 0, BINS - 1)
+
+
+def _simulate_chunk(task):
+    """Simulate `paths` paths with their own RNG stream; returns (histogram per checkpoint, sum per checkpoint)."""
+    seed, paths = task
+    model = _model
+    rng = np.random.default_rng(seed)
+    exposure, cash, steps = model['exposure'], model['cash'], model['steps']
+    initial = cash + exposure.sum()
+    # money in each position per path when rebalancing, otherwise price relative to today's
+    shape = (paths, len(exposure))
+    holdings = np.broadcast_to(exposure, shape).copy() if model['rebalance'] else None
+    growth = None if model['rebalance'] else np.ones(shape)
+    cash = np.full(paths, cash)
+    # a chunk never has more than 2**31 paths, so int32 counts do
+    histograms = np.zeros((model['checkpoints'], BINS), dtype=np.int32)
+    sums = np.zeros(model['checkpoints'])
+    for days, rebalance, checkpoint in steps:
+        if model['method'] == 'gbm':
+            shocks = rng.standard_normal(shape) @ model['cholesky'].T
+            step = np.exp(model['drift'] * days + np.sqrt(days) * shocks)
+        else:
+            # a whole day of history (every symbol together) per draw keeps the cross-correlation
+            log_returns = model['log_returns']
+            total = np.zeros(shape)
+            for _ in range(days):
+                total += log_returns[rng.integers(len(log_returns), size=paths)]
+            step = np.exp(total)
+        if model['rebalance']:
+            holdings *= step
+            values = cash + holdings.sum(axis=1)
+            if rebalance:
+                # back to today's weights, paying the trader's fee on everything bought or sold
+                target = values[:, None] * model['weights']
+                cash -= model['fee'] * np.abs(target - holdings).sum(axis=1)
+                cash += holdings.sum(axis=1) - target.sum(axis=1)
+                holdings = target
+                values = cash + holdings.sum(axis=1)
+        else:
+            growth *= step
+            values = cash + growth @ exposure
+        if checkpoint >= 0:
+            histograms[checkpoint] = np.bincount(_bins(values, initial), minlength=BINS)
+            sums[checkpoint] = values.sum()
+    return histograms, sums
+
+
+def _band(histogram, percentile, initial):
+    cumulative = np.cumsum(histogram)
+    rank = percentile / 100 * cumulative[-1]
+    i = min(int(np.searchsorted(cumulative, rank)), BINS - 1)
+    # interpolate inside the bin, as if its values were spread evenly over it
+    below = cumulative[i - 1] if i else 0
+    inside = (rank - below) / histogram[i] if histogram[i] else 0.5
+    return initial * np.exp(-LOG_RANGE + (i + inside) * 2 * LOG_RANGE / BINS)
+
+
+def simulate(owned, balance, bars, fee: float = 0, horizon: int = 252, paths: int = 1_000_000,
+             method: str = 'gbm', rebalance_every: int = None, checkpoints: int = 12, prices=None,
+             percentiles=PERCENTILES, chunk_size: int = 20_000, seed=None, max_workers: int = None):
+    """Monte Carlo net worth of holdings {symbol: shares} plus `balance` cash, `horizon` trading days out.
+
+    Prices move as a correlated geometric Brownian motion fitted to the daily log returns in `bars`
+    ('gbm'), or by resampling whole days of those returns ('bootstrap'). With `rebalance_every`, the
+    positions are traded back to today's weights every that many days and the fee is charged on the
+    traded value, as Trader does. Holdings are priced at `prices` (default: the last close in `bars`);
+    symbols with no price are left out and listed in `missing`.
+
+    Paths are simulated in chunks of `chunk_size` on a process pool, each chunk with its own stream
+    spawned from `seed`, so results depend on the seed but not on the number of workers. Workers only
+    return a histogram per checkpoint, and only a couple of chunks per worker are in flight at a time,
+    which keeps memory flat however many paths (and rebalances) are asked for.
+    """
+    assert method in METHODS, f"method must be one of {METHODS}"
+    held = {name: amount for name, amount in owned.items() if amount}
+    closes = bars.filled_close()
+    if prices is None:
+        prices = {symbol: float(closes[-1, j]) for symbol, j in bars.columns.items()
+                  if len(closes) and not np.isnan(closes[-1, j])}
+    missing = [name for name in held if name not in bars.columns or name not in prices]
+    symbols = [name for name in held if name not in missing]
+    columns = [bars.columns[symbol] for symbol in symbols]
+    exposure = np.array([held[symbol] * prices[symbol] for symbol in symbols], dtype=np.float64)
+    initial = balance + exposure.sum()
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_returns = np.nan_to_num(np.diff(np.log(closes[:, columns]), axis=0), nan=0.0, posinf=0.0, neginf=0.0)
+    # checkpoints every `stride` days whatever the rebalancing; the paths are stepped from one
+    # checkpoint or rebalance day to the next, and only checkpoints are histogrammed
+    stride = max(1, horizon // checkpoints)
+    days = list(range(stride, horizon, stride)) + [horizon]
+    rebalances = set(range(rebalance_every, horizon, rebalance_every)) if rebalance_every else set()
+    events = sorted(set(days) | rebalances)
+    checkpoint = {day: k for k, day in enumerate(days)}
+    steps = [(day - previous, day in rebalances, checkpoint.get(day, -1))
+             for previous, day in zip([0] + events, events)]
+    model = {'method': method, 'exposure': exposure, 'cash': float(balance), 'steps': steps,
+             'checkpoints': len(days), 'rebalance': bool(rebalance_every), 'fee': fee,
+             'weights': exposure / initial if initial else exposure * 0}
+    if method == 'gbm':
+        covariance = np.atleast_2d(np.cov(log_returns, rowvar=False)) if len(log_returns) > 1 \
+            else np.zeros((len(symbols), len(symbols)))
+        # a tiny ridge keeps the factorization working for singular (e.g. duplicated) histories
+        model['cholesky'] = np.linalg.cholesky(covariance + np.eye(len(symbols)) * 1e-12)
+        model['drift'] = log_returns.mean(axis=0) if len(log_returns) else np.zeros(len(symbols))
+    else:
+        assert len(log_returns), "bootstrapping needs at least two days of history"
+        model['log_returns'] = log_returns
+
+    sizes = [chunk_size] * (paths // chunk_size) + ([paths % chunk_size] if paths % chunk_size else [])
+    tasks = list(zip(np.random.SeedSequence(seed).spawn(len(sizes)), sizes))
+    histograms = np.zeros((len(days), BINS), dtype=np.int64)
+    # per chunk, added up in chunk order at the end so the mean doesn't depend on which chunk finished first
+    chunk_sums = np.zeros((len(tasks), len(days)))
+    if max_workers == 1 or len(tasks) == 1:
+        _set_model(model)
+        for i, task in enumerate(tasks):
+            chunk_histograms, chunk_sums[i] = _simulate_chunk(task)
+            histograms += chunk_histograms
+    else:
+        workers = max_workers or os.cpu_count()
+        with ProcessPoolExecutor(workers, initializer=_set_model, initargs=(model,)) as pool:
+            # a bounded window of chunks in flight, merged in whatever order they finish
+            pending = dict()
+            queued = iter(enumerate(tasks))
+            for i, task in queued:
+                pending[pool.submit(_simulate_chunk, task)] = i
+                if len(pending) >= 2 * workers:
+                    break
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i = pending.pop(future)
+                    chunk_histograms, chunk_sums[i] = future.result()
+                    histograms += chunk_histograms
+                    following = next(queued, None)
+                    if following is not None:
+                        pending[pool.submit(_simulate_chunk, following[1])] = following[0]
+    sums = chunk_sums.sum(axis=0)
+    bands = {p: np.array([_band(histogram, p, initial) for histogram in histograms]) for p in percentiles}
+    return MonteCarloResult(np.array(days), bands, sums / paths, initial, paths, missing)
+
+
+def simulate_trader(trader, bars, **kwargs):
+    """simulate() for a Trader's holdings, balance and fee."""
+    kwargs.setdefault('fee', trader.fee)
+    return simulate(trader.owned, trader.balance, bars, **kwargs)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Monte Carlo net worth bands for a saved profile")
+    parser.add_argument('profile', help="profile to simulate (.pickle, .journal or .db)")
+    parser.add_argument('--username', help="profile to pick from a .db")
+    parser.add_argument('--store', help="price store directory (see pricestore.py)")
+    parser.add_argument('--horizon', type=int, default=252, help="trading days to simulate")
+    parser.add_argument('--paths', type=int, default=1_000_000)
+    parser.add_argument('--method', choices=METHODS, default='gbm')
+    parser.add_argument('--rebalance', type=int, help="rebalance to today's weights every this many days")
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--workers', type=int)
+    args = parser.parse_args()
+
+    from pricestore import STORE_DIR, PriceStore
+    from Trader import load_trader_from_file
+    trader = load_trader_from_file(args.profile, args.username)
+    bars = PriceStore(args.store or STORE_DIR).bars([name for name, amount in trader.owned.items() if amount])
+    start = time.perf_counter()
+    result = simulate_trader(trader, bars, horizon=args.horizon, paths=args.paths, method=args.method,
+                             rebalance_every=args.rebalance, seed=args.seed, max_workers=args.workers)
+    print(f"{result.paths} paths in {time.perf_counter() - start:.2f}s, net worth now {result.initial:.2f}")
+    if result.missing:
+        print(f"left out (no price history): {', '.join(result.missing)}")
+    for i, day in enumerate(result.days):
+        bands = '  '.join(f"p{p} {values[i]:12.2f}" for p, values in result.bands.items())
+        print(f"day {day:>4}  {bands}  mean {result.mean[i]:12.2f}")
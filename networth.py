@@ -0,0 +1,102 @@
+from collections import namedtuple
+
+import numpy as np
+
+from backtest import forward_fill, ledger_arrays
+
+# one entry per bar; `missing` lists traded symbols the bars have no prices for (they count as 0)
+NetWorthSeries = namedtuple('NetWorthSeries', ['dates', 'net_worth', 'cash', 'holdings_value', 'missing'])
+
+
+class NetWorthHistory:
+    """A trader's net worth at the end of every bar, rebuilt from its TradeLedger and a Bars price history.
+
+    Holdings are the running sum of the ledger's amounts, stepped onto the bar times and multiplied
+    with the (forward filled) closes in one pass. Computed days are cached: a later call with more
+    bars only computes the new ones, and new trades only invalidate the days from the first one they
+    land in. The ledger doesn't record deposits, so cash is anchored on the trader's current balance
+    and walked back through the trades; money added or removed shows up as if it had always been there.
+    """
+
+    def __init__(self, trader):
+        self.trader = trader
+        self._symbols = None
+        self._times = np.zeros(0)  # bar end epochs of the cached days
+        self._holdings = np.zeros((0, 0))  # shares held per bars symbol at the end of each cached day
+        self._holdings_value = np.zeros(0)
+        self._flows = np.zeros(0)  # cash moved by the trades up to the end of each cached day
+        self._rows = np.zeros(0, dtype=np.int64)  # ledger rows dated up to the end of each cached day
+        self._prices = np.zeros(0)  # last known close per symbol, as of the last cached day
+
+    def __len__(self):
+        return len(self._times)
+
+    def clear(self):
+        self.__init__(self.trader)
+
+    def series(self, bars, times=None):
+        """NetWorthSeries over `bars`; `times` are the bars' end times (datetimes), by default each date's close."""
+        times = np.array([when.timestamp() for when in (bars.datetimes() if times is None else times)])
+        if self._symbols != bars.symbols:
+            self.clear()
+            self._symbols = list(bars.symbols)
+            self._holdings = np.zeros((0, len(bars.symbols)))
+            self._prices = np.full(len(bars.symbols), np.nan)
+        ledger = self.trader.trades
+        symbols, amount, price, fee, timestamp = ledger_arrays(ledger)
+        kept = self._valid_days(bars, times, timestamp)
+        if kept < len(times):
+            self._extend(bars, times, kept, symbols, amount, price, fee, timestamp)
+        # cash after day d = balance now, minus what the trades made after day d moved
+        flows = -(amount * price + fee)
+        cash = self.trader.balance - (flows.sum() - self._flows[:len(times)])
+        holdings_value = self._holdings_value[:len(times)]
+        missing = [name for name in ledger.symbols if name not in bars.columns]
+        return NetWorthSeries(bars.dates, cash + holdings_value, cash, holdings_value, missing)
+
+    def _valid_days(self, bars, times, timestamp):
+        """How many leading cached days still hold for these bar times and this ledger; drops the rest."""
+        n = min(len(self._times), len(times))
+        kept = n if np.array_equal(self._times[:n], times[:n]) else int(np.argmin(self._times[:n] == times[:n]))
+        rows = np.searchsorted(timestamp, self._times[:kept], side='right')
+        changed = np.flatnonzero(rows != self._rows[:kept])
+        if len(changed):
+            # trades were added into cached days: everything from the first such day is recomputed
+            kept = int(changed[0])
+        if kept < len(self._times):
+            self._prices = forward_fill(bars.close[:kept])[-1] if kept else np.full(len(self._symbols), np.nan)
+            self._times, self._holdings = self._times[:kept], self._holdings[:kept]
+            self._holdings_value, self._flows, self._rows = \
+                self._holdings_value[:kept], self._flows[:kept], self._rows[:kept]
+        return kept
+
+    def _extend(self, bars, times, kept, symbols, amount, price, fee, timestamp):
+        new_times = times[kept:]
+        # only the trades after the last cached day are looked at; earlier ones are in the carried over holdings
+        first = int(self._rows[-1]) if kept else 0
+        symbols, amount, price, fee, timestamp = (column[first:] for column in (symbols, amount, price, fee, timestamp))
+        to_column = np.array([bars.columns.get(name, -1) for name in self.trader.trades.symbols] + [-1],
+                             dtype=np.int64)
+        columns = to_column[symbols]
+        # a trade counts from the first bar ending at or after it (so trades before the first bar count towards it)
+        days = np.searchsorted(new_times, timestamp, side='left')
+        inside = days < len(new_times)
+        held = inside & (columns >= 0)
+        deltas = np.zeros((len(new_times), len(self._symbols)))
+        np.add.at(deltas, (days[held], columns[held]), amount[held])
+        flows = np.zeros(len(new_times))
+        np.add.at(flows, days[inside], -(amount * price + fee)[inside])
+
+        base = self._holdings[-1] if kept else np.zeros(len(self._symbols))
+        holdings = base + np.cumsum(deltas, axis=0)
+        closes = bars.close[kept:len(times)]
+        # carry the last known prices into the new days, then fill forward inside them
+        filled = forward_fill(np.vstack([self._prices, closes]))[1:]
+        holdings_value = np.nansum(holdings * filled, axis=1)
+
+        self._times = np.concatenate([self._times, new_times])
+        self._holdings = np.vstack([self._holdings, holdings])
+        self._holdings_value = np.concatenate([self._holdings_value, holdings_value])
+        self._flows = np.concatenate([self._flows, (self._flows[-1] if kept else 0.0) + np.cumsum(flows)])
+        self._rows = np.concatenate([self._rows, first + np.searchsorted(timestamp, new_times, side='right')])
+        self._prices = filled[-1]
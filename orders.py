@@ -0,0 +1,209 @@
+import heapq
+import threading
+from itertools import count
+
+import metrics
+from Trader import Order
+
+ORDER_KINDS = ('limit', 'stop', 'stop_limit')
+
+
+class RestingOrder:
+    """A limit, stop or stop-limit order waiting in an OrderBook.
+
+    limit: buy once the price is at or below limit_price, sell once it is at or above it.
+    stop: buy once the price is at or above stop_price, sell once it is at or below it (then fills at market).
+    stop_limit: once the stop is crossed the order becomes a limit order at limit_price.
+    status is 'pending', 'filled', 'rejected' (the fill failed, `error` says why) or 'cancelled'.
+    """
+    __slots__ = ('order_id', 'side', 'stock_name', 'kind', 'amount', 'value', 'limit_price', 'stop_price',
+                 'status', 'stopped', 'fill', 'error')
+
+    def __init__(self, order_id, side, stock_name, kind, amount=None, value=None, limit_price=None,
+                 stop_price=None):
+        self.order_id = order_id
+        self.side = side
+        self.stock_name = stock_name
+        self.kind = kind
+        self.amount = amount
+        self.value = value
+        self.limit_price = limit_price
+        self.stop_price = stop_price
+        self.status = 'pending'
+        self.stopped = False  # a stop-limit whose stop was crossed, now resting as a limit order
+        self.fill = None
+        self.error = None
+
+    def __repr__(self):
+        return (f"RestingOrder({self.order_id}, {self.side} {self.stock_name} {self.kind}, amount={self.amount}, "
+                f"value={self.value}, limit={self.limit_price}, stop={self.stop_price}, {self.status})")
+
+
+class _SymbolBook:
+    """Resting orders of one symbol in two heaps, keyed by the price that triggers them.
+
+    `rising` holds what triggers once the price goes up to its key (limit sells, stop buys) as a min heap;
+    `falling` what triggers once it comes down to its key (limit buys, stop sells) as a max heap (keys
+    negated). A tick only pops entries off the tops until it reaches one that wasn't crossed.
+    """
+    __slots__ = ('rising', 'falling')
+
+    def __init__(self):
+        self.rising = []
+        self.falling = []
+
+    def crossed(self, price):
+        triggered = []
+        while self.rising and self.rising[0][0] <= price:
+            triggered.append(heapq.heappop(self.rising))
+        while self.falling and -self.falling[0][0] >= price:
+            triggered.append(heapq.heappop(self.falling))
+        # the sequence numbers keep fills in the order the orders were placed (or re-armed)
+        triggered.sort(key=lambda entry: entry[1])
+        return [order for _, _, order in triggered]
+
+
+class OrderBook:
+    """Resting limit/stop/stop-limit orders for one Trader, executed as prices come in.
+
+    Feed it prices with on_tick(symbol, price) (the signature QuoteStream subscribers get, so
+    `stream.subscribe(book.symbols(), book.on_tick)` works) or check(prices) for a dict of quotes.
+    Only orders whose trigger price was crossed are looked at, everything else stays in its heap.
+    Triggered orders fill at the tick price through Trader.execute_batch, so the usual balance and
+    holdings checks and the trader's fee apply; a fill that fails those marks the order 'rejected'.
+
+    The book does not lock the Trader: when ticks arrive on a feed thread, don't trade on it from
+    another thread at the same time.
+    """
+
+    def __init__(self, trader):
+        self.trader = trader
+        self.orders = dict()  # order_id -> RestingOrder, pending ones only
+        self._books = dict()  # symbol -> _SymbolBook
+        self._ids = count(1)
+        self._seq = count()
+        self._entries = 0  # heap entries, including the ones of orders no longer pending
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.orders)
+
+    def place(self, side, stock_name, kind='limit', amount=None, value=None, limit_price=None, stop_price=None):
+        """Add a resting order and return it; give either amount (shares) or value (money), like Order."""
+        assert side in ('buy', 'sell'), f"side must be 'buy' or 'sell', not {side!r}"
+        assert kind in ORDER_KINDS, f"kind must be one of {ORDER_KINDS}"
+        assert (amount is None) ^ (value is None), f"give either amount or value for {stock_name}"
+        if kind in ('limit', 'stop_limit'):
+            assert limit_price is not None and limit_price > 0, f"a {kind} order needs a positive limit_price"
+        if kind in ('stop', 'stop_limit'):
+            assert stop_price is not None and stop_price > 0, f"a {kind} order needs a positive stop_price"
+        with self._lock:
+            order = RestingOrder(next(self._ids), side, stock_name, kind, amount, value, limit_price, stop_price)
+            self.orders[order.order_id] = order
+            self._arm(order)
+        return order
+
+    def buy_limit(self, stock_name, limit_price, amount=None, value=None):
+        return self.place('buy', stock_name, 'limit', amount, value, limit_price=limit_price)
+
+    def sell_limit(self, stock_name, limit_price, amount=None, value=None):
+        return self.place('sell', stock_name, 'limit', amount, value, limit_price=limit_price)
+
+    def buy_stop(self, stock_name, stop_price, amount=None, value=None, limit_price=None):
+        kind = 'stop' if limit_price is None else 'stop_limit'
+        return self.place('buy', stock_name, kind, amount, value, limit_price, stop_price)
+
+    def sell_stop(self, stock_name, stop_price, amount=None, value=None, limit_price=None):
+        kind = 'stop' if limit_price is None else 'stop_limit'
+        return self.place('sell', stock_name, kind, amount, value, limit_price, stop_price)
+
+    def _arm(self, order):
+        self._entries += 1
+        book = self._books.get(order.stock_name)
+        if book is None:
+            book = self._books[order.stock_name] = _SymbolBook()
+        buy = order.side == 'buy'
+        if order.kind == 'limit' or order.stopped:
+            price, rises = order.limit_price, not buy
+        else:
+            price, rises = order.stop_price, buy
+        if rises:
+            heapq.heappush(book.rising, (price, next(self._seq), order))
+        else:
+            heapq.heappush(book.falling, (-price, next(self._seq), order))
+
+    def cancel(self, order_id):
+        """Cancel a pending order; returns False if it already filled, failed or was cancelled."""
+        with self._lock:
+            order = self.orders.pop(order_id, None)
+            if order is None:
+                return False
+            # its heap entry is skipped (and dropped) when it comes up, instead of searching the heap now
+            order.status = 'cancelled'
+            if self._entries > 2 * len(self.orders) + 1024:
+                self._compact()
+            return True
+
+    def _compact(self):
+        # mostly cancelled entries by now, rebuild the heaps from the pending orders
+        for book in self._books.values():
+            book.rising = [entry for entry in book.rising if entry[2].status == 'pending']
+            book.falling = [entry for entry in book.falling if entry[2].status == 'pending']
+            heapq.heapify(book.rising)
+            heapq.heapify(book.falling)
+        self._books = {symbol: book for symbol, book in self._books.items() if book.rising or book.falling}
+        self._entries = sum(len(book.rising) + len(book.falling) for book in self._books.values())
+
+    def pending(self, stock_name=None):
+        with self._lock:
+            return [order for order in self.orders.values() if stock_name is None or order.stock_name == stock_name]
+
+    def symbols(self):
+        with self._lock:
+            return [symbol for symbol, book in self._books.items() if book.rising or book.falling]
+
+    def on_tick(self, symbol, price):
+        """Execute whatever `price` triggers for `symbol`; returns the orders that filled or were rejected."""
+        book = self._books.get(symbol)
+        if book is None:
+            return []
+        done = []
+        with self._lock:
+            triggered = book.crossed(price)
+            self._entries -= len(triggered)
+            while triggered:
+                rearmed = False
+                for order in triggered:
+                    if order.status != 'pending':
+                        continue
+                    if order.kind == 'stop_limit' and not order.stopped:
+                        # the stop was crossed: rest as a limit order, which this same price may already fill
+                        order.stopped = True
+                        self._arm(order)
+                        rearmed = True
+                        continue
+                    self._execute(order, price)
+                    done.append(order)
+                triggered = book.crossed(price) if rearmed else None
+                self._entries -= len(triggered or ())
+        return done
+
+    def check(self, prices):
+        """on_tick for every (symbol, price) in `prices`."""
+        done = []
+        for symbol, price in prices.items():
+            done += self.on_tick(symbol, price)
+        return done
+
+    def _execute(self, order, price):
+        del self.orders[order.order_id]
+        try:
+            order.fill, = self.trader.execute_batch([Order(order.side, order.stock_name, order.amount, order.value)],
+                                                    prices={order.stock_name: price})
+        except (AssertionError, ValueError) as e:
+            order.status = 'rejected'
+            order.error = str(e)
+            metrics.incr('orders.rejected')
+        else:
+            order.status = 'filled'
+            metrics.incr('orders.filled')
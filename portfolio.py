@@ -0,0 +1,136 @@
+from collections import deque
+
+COST_BASIS_METHODS = ('fifo', 'lifo', 'average')
+
+
+class Position:
+    __slots__ = ('quantity', 'cost', 'realized', 'lots')
+
+    def __init__(self):
+        self.quantity = 0.0
+        self.cost = 0.0  # book cost of the shares still held
+        self.realized = 0.0
+        self.lots = deque()  # [quantity, share price] per buy, oldest first
+
+    def __getstate__(self):
+        return self.quantity, self.cost, self.realized, list(self.lots)
+
+    def __setstate__(self, state):
+        self.quantity, self.cost, self.realized, lots = state
+        self.lots = deque(lots)
+
+    @property
+    def average_cost(self):
+        return self.cost / self.quantity if self.quantity > 0 else 0.0
+
+
+class Portfolio:
+    """Running per-symbol accounting, updated in O(1) (amortized, for the lot queues) per fill.
+
+    Tracks quantity, cost basis and realized P&L per symbol using the `method` cost basis
+    (fifo / lifo lots or a moving average), plus totals for fees paid and sell proceeds.
+    Realized P&L is before fees; see net_realized.
+    """
+
+    def __init__(self, method='fifo'):
+        assert method in COST_BASIS_METHODS, f"cost basis method must be one of {COST_BASIS_METHODS}"
+        self.method = method
+        self.positions = dict()
+        self.realized = 0.0
+        self.fees = 0.0
+        self.proceeds = 0.0
+
+    @classmethod
+    def from_ledger(cls, ledger, method='fifo'):
+        portfolio = cls(method)
+        for name, amount, share_value, fee, _ in ledger.records():
+            portfolio.apply(name, amount, share_value, fee)
+        return portfolio
+
+    def apply(self, name, amount, share_value, fee=0.0):
+        position = self.positions.get(name)
+        if position is None:
+            position = self.positions[name] = Position()
+        self.fees += fee
+        if amount >= 0:
+            position.quantity += amount
+            position.cost += amount * share_value
+            if self.method != 'average':
+                position.lots.append([amount, share_value])
+            return
+        sold = -amount
+        self.proceeds += sold * share_value
+        cost = self._remove_cost(position, sold)
+        position.quantity -= sold
+        position.cost -= cost
+        if position.quantity <= 1e-12:
+            # fully closed, drop the float dust
+            position.quantity = 0.0
+            position.cost = 0.0
+            position.lots.clear()
+        realized = sold * share_value - cost
+        position.realized += realized
+        self.realized += realized
+
+    def _remove_cost(self, position, sold):
+        if self.method == 'average':
+            return sold * position.average_cost
+        lots = position.lots
+        cost = 0.0
+        while sold > 1e-12 and lots:
+            lot = lots[0] if self.method == 'fifo' else lots[-1]
+            used = min(sold, lot[0])
+            cost += used * lot[1]
+            lot[0] -= used
+            sold -= used
+            if lot[0] <= 1e-12:
+                if self.method == 'fifo':
+                    lots.popleft()
+                else:
+                    lots.pop()
+        return cost
+
+    @property
+    def net_realized(self):
+        return self.realized - self.fees
+
+    def quantity(self, name):
+        position = self.positions.get(name)
+        return position.quantity if position else 0.0
+
+    def cost_basis(self, name):
+        position = self.positions.get(name)
+        return position.cost if position else 0.0
+
+    def average_cost(self, name):
+        position = self.positions.get(name)
+        return position.average_cost if position else 0.0
+
+    def unrealized(self, prices):
+        return sum(p.quantity * prices[name] - p.cost for name, p in self.positions.items() if p.quantity)
+
+
+def check_consistency(trader, tolerance=1e-6):
+    """Replay the trader's whole ledger and compare it with the running aggregates.
+
+    Returns a list of human readable mismatches; an empty list means everything agrees.
+    """
+    portfolio = trader.portfolio
+    replayed = Portfolio.from_ledger(trader.trades, portfolio.method)
+    problems = []
+
+    def compare(what, running, expected):
+        if abs(running - expected) > tolerance * max(1.0, abs(expected)):
+            problems.append(f"{what}: running {running!r}, replayed {expected!r}")
+
+    compare('realized', portfolio.realized, replayed.realized)
+    compare('fees', portfolio.fees, replayed.fees)
+    compare('proceeds', portfolio.proceeds, replayed.proceeds)
+    for name in set(portfolio.positions) | set(replayed.positions) | set(trader.owned):
+        compare(f'{name} quantity', portfolio.quantity(name), replayed.quantity(name))
+        compare(f'{name} owned', trader.owned.get(name, 0), replayed.quantity(name))
+        compare(f'{name} cost basis', portfolio.cost_basis(name), replayed.cost_basis(name))
+        running = portfolio.positions.get(name)
+        expected = replayed.positions.get(name)
+        compare(f'{name} realized', running.realized if running else 0.0, expected.realized if expected else 0.0)
+    return problems
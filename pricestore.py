@@ -0,0 +1,174 @@
+"""Local daily OHLCV history, one fixed-width append-only binary file per ticker.
+
+    python pricestore.py import dumps/              # <SYMBOL>.csv files (e.g. yfinance dumps)
+    python pricestore.py refresh AAPL MSFT          # append the bars newer than what's stored, from Yahoo
+    python pricestore.py refresh --universe         # ... for every ticker in valid_tickers.csv
+    python pricestore.py info AAPL
+"""
+import argparse
+import datetime
+import os
+
+import numpy as np
+
+from backtest import FIELDS, align_bars, read_bars_csv
+
+STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'prices')
+SUFFIX = '.ohlcv'
+# one bar per record, little endian, 48 bytes; files are nothing but these records in date order
+RECORD = np.dtype([('date', '<M8[D]')] + [(field, '<f8') for field in FIELDS])
+
+
+class PriceStore:
+    """Daily bars on disk, read through numpy.memmap.
+
+    read() returns a memory mapped slice, so pulling a date range out of a long history copies nothing
+    and costs a binary search. Writes only ever append bars dated after the last stored one; a
+    partially written record at the end of a file (from a crash mid-append) is ignored and then cut
+    off by the next append.
+    """
+
+    def __init__(self, directory=STORE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, symbol):
+        return os.path.join(self.directory, symbol + SUFFIX)
+
+    def symbols(self):
+        return sorted(name[:-len(SUFFIX)] for name in os.listdir(self.directory) if name.endswith(SUFFIX))
+
+    def __contains__(self, symbol):
+        return os.path.exists(self.path(symbol))
+
+    def _records(self, symbol):
+        try:
+            size = os.path.getsize(self.path(symbol))
+        except FileNotFoundError:
+            return np.zeros(0, dtype=RECORD)
+        count = size // RECORD.itemsize
+        if not count:
+            return np.zeros(0, dtype=RECORD)
+        return np.memmap(self.path(symbol), dtype=RECORD, mode='r', shape=(count,))
+
+    def read(self, symbol, start=None, end=None):
+        """The stored bars of `symbol` dated in [start, end), as a read-only structured array view."""
+        records = self._records(symbol)
+        dates = records['date']
+        lo = 0 if start is None else np.searchsorted(dates, np.datetime64(start, 'D'))
+        hi = len(records) if end is None else np.searchsorted(dates, np.datetime64(end, 'D'))
+        return records[lo:hi]
+
+    def last_date(self, symbol):
+        records = self._records(symbol)
+        return records['date'][-1] if len(records) else None
+
+    def append(self, symbol, dates, values):
+        """Store the bars (dates, values[n x 5]) dated after the last stored bar; returns how many were added."""
+        dates = np.asarray(dates, dtype='datetime64[D]')
+        values = np.asarray(values, dtype=np.float64).reshape(-1, len(FIELDS))
+        order = np.argsort(dates, kind='stable')
+        dates, values = dates[order], values[order]
+        last = self.last_date(symbol)
+        if last is not None:
+            newer = dates > last
+            dates, values = dates[newer], values[newer]
+        # a day given twice keeps its last bar
+        keep = np.append(dates[1:] != dates[:-1], True) if len(dates) else np.zeros(0, dtype=bool)
+        dates, values = dates[keep], values[keep]
+        if not len(dates):
+            return 0
+        records = np.empty(len(dates), dtype=RECORD)
+        records['date'] = dates
+        for i, field in enumerate(FIELDS):
+            records[field] = values[:, i]
+        path = self.path(symbol)
+        with open(path, 'ab') as f:
+            torn = f.tell() % RECORD.itemsize
+            if torn:
+                f.truncate(f.tell() - torn)
+                f.seek(0, os.SEEK_END)
+            f.write(records.tobytes())
+        return len(records)
+
+    def import_csv(self, path, symbol=None):
+        """Append the bars in a Date/Open/High/Low/Close[/Volume] csv; the symbol defaults to the file name."""
+        symbol = symbol or os.path.splitext(os.path.basename(path))[0]
+        return self.append(symbol, *read_bars_csv(path))
+
+    def import_directory(self, directory, symbols=None):
+        """import_csv every <SYMBOL>.csv in `directory` (or just those of `symbols`); returns {symbol: bars added}."""
+        if symbols is None:
+            symbols = sorted(name[:-4] for name in os.listdir(directory) if name.endswith('.csv'))
+        added = dict()
+        for symbol in symbols:
+            path = os.path.join(directory, f"{symbol}.csv")
+            if os.path.exists(path):
+                added[symbol] = self.import_csv(path, symbol)
+        return added
+
+    def refresh(self, symbol, fetch=None, start=None):
+        """Fetch and append the bars after the last stored one; `fetch(symbol, start)` returns (dates, values)."""
+        last = self.last_date(symbol)
+        if last is not None:
+            start = (last + np.timedelta64(1, 'D')).astype(datetime.date)
+        if start is not None and start > datetime.date.today():
+            return 0
+        return self.append(symbol, *(fetch or yahoo_history)(symbol, start))
+
+    def bars(self, symbols=None, start=None, end=None):
+        """The stored history of `symbols` in [start, end) as Bars, aligned on the union of their dates."""
+        symbols = self.symbols() if symbols is None else list(symbols)
+        per_symbol = []
+        for symbol in symbols:
+            records = self.read(symbol, start, end)
+            per_symbol.append((np.asarray(records['date']),
+                               np.column_stack([records[field] for field in FIELDS]).reshape(-1, len(FIELDS))))
+        return align_bars(symbols, per_symbol)
+
+
+def yahoo_history(symbol, start=None):
+    """Daily bars from Yahoo since `start` (everything there is when None), as (dates, values[n x 5])."""
+    import yfinance as yf
+    frame = yf.Ticker(symbol).history(start=start, period=None if start else 'max', interval='1d',
+                                      auto_adjust=False)
+    if frame.empty:
+        return np.zeros(0, dtype='datetime64[D]'), np.zeros((0, len(FIELDS)))
+    dates = np.array(frame.index.strftime('%Y-%m-%d'), dtype='datetime64[D]')
+    return dates, frame[['Open', 'High', 'Low', 'Close', 'Volume']].to_numpy(dtype=np.float64)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--store', default=STORE_DIR, help="directory the .ohlcv files live in")
+    commands = parser.add_subparsers(dest='command', required=True)
+    import_parser = commands.add_parser('import', help="append bars from a directory of <SYMBOL>.csv files")
+    import_parser.add_argument('directory')
+    refresh_parser = commands.add_parser('refresh', help="append new bars from Yahoo")
+    refresh_parser.add_argument('symbols', nargs='*')
+    refresh_parser.add_argument('--universe', action='store_true', help="every ticker in valid_tickers.csv")
+    info_parser = commands.add_parser('info', help="date range and bar count per stored symbol")
+    info_parser.add_argument('symbols', nargs='*')
+    args = parser.parse_args()
+
+    store = PriceStore(args.store)
+    if args.command == 'import':
+        added = store.import_directory(args.directory)
+        print(f"Imported {sum(added.values())} bars for {len(added)} symbols into {args.store}")
+    elif args.command == 'refresh':
+        symbols = args.symbols
+        if args.universe:
+            from tickers import TickerIndex
+            symbols = list(TickerIndex.load(with_dots=False))
+        for symbol in symbols:
+            try:
+                print(f"{symbol}: {store.refresh(symbol)} new bars")
+            except Exception as e:
+                print(f"{symbol}: failed ({e})")
+    else:
+        for symbol in args.symbols or store.symbols():
+            records = store.read(symbol)
+            if len(records):
+                print(f"{symbol}: {len(records)} bars, {records['date'][0]} to {records['date'][-1]}")
+            else:
+                print(f"{symbol}: no bars")
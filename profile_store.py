@@ -0,0 +1,153 @@
+import os
+import time
+
+from ledger import TradeLedger
+from portfolio import Portfolio
+
+SQLITE_SUFFIXES = ('.db', '.sqlite', '.sqlite3')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS traders (
+    id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL UNIQUE,
+    fee REAL NOT NULL,
+    balance REAL NOT NULL,
+    cost_basis TEXT NOT NULL DEFAULT 'fifo',
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS holdings (
+    trader_id INTEGER NOT NULL REFERENCES traders(id) ON DELETE CASCADE,
+    symbol TEXT NOT NULL,
+    amount REAL NOT NULL,
+    PRIMARY KEY (trader_id, symbol)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS holdings_symbol ON holdings(symbol);
+CREATE TABLE IF NOT EXISTS trades (
+    trader_id INTEGER NOT NULL REFERENCES traders(id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    symbol TEXT NOT NULL,
+    amount REAL NOT NULL,
+    share_value REAL NOT NULL,
+    fee REAL NOT NULL,
+    time REAL NOT NULL,
+    PRIMARY KEY (trader_id, seq)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS trades_time ON trades(trader_id, time);
+CREATE INDEX IF NOT EXISTS trades_symbol_time ON trades(symbol, time);
+"""
+
+
+class ProfileStore:
+    """All profiles in one SQLite database (WAL mode), queryable across accounts.
+
+    save() only inserts the trades added since the trader was last loaded from or saved to this
+    database, in one executemany; any other Trader under the same username replaces the stored trades.
+    """
+
+    def __init__(self, path):
+        import sqlite3  # only needed once a database is actually opened
+        self.path = path
+        self._key = os.path.realpath(path)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('PRAGMA foreign_keys=ON')
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _trader_id(self, username):
+        row = self.connection.execute('SELECT id FROM traders WHERE username = ?', (username,)).fetchone()
+        return row[0] if row else None
+
+    def save(self, trader):
+        with self.connection:
+            self.connection.execute(
+                'INSERT INTO traders (username, fee, balance, cost_basis, updated) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT(username) DO UPDATE SET fee = excluded.fee, balance = excluded.balance, '
+                'cost_basis = excluded.cost_basis, updated = excluded.updated',
+                (trader.username, trader.fee, trader.balance, trader.portfolio.method, time.time()))
+            trader_id = self._trader_id(trader.username)
+            self.connection.execute('DELETE FROM holdings WHERE trader_id = ?', (trader_id,))
+            self.connection.executemany('INSERT INTO holdings VALUES (?, ?, ?)',
+                                        ((trader_id, name, amount) for name, amount in trader.owned.items()))
+            stored = self.connection.execute('SELECT COUNT(*) FROM trades WHERE trader_id = ?',
+                                             (trader_id,)).fetchone()[0]
+            ledger = trader.trades
+            if getattr(trader, 'stored_in', None) != (self._key, stored) or stored > len(ledger):
+                # not the trader these rows came from (e.g. a new profile reusing the name): write it all
+                self.connection.execute('DELETE FROM trades WHERE trader_id = ?', (trader_id,))
+                stored = 0
+            self.connection.executemany(
+                'INSERT INTO trades VALUES (?, ?, ?, ?, ?, ?, ?)',
+                ((trader_id, seq, ledger.name(seq), ledger.amount(seq), ledger.share_value(seq), ledger.fee(seq),
+                  ledger.timestamp(seq)) for seq in range(stored, len(ledger))))
+        trader.stored_in = (self._key, len(ledger))
+
+    def load(self, username=None):
+        if username is None:
+            usernames = self.usernames()
+            if len(usernames) != 1:
+                raise ValueError(f"{self.path} holds {len(usernames)} profiles, pick one of: {', '.join(usernames)}")
+            username = usernames[0]
+        row = self.connection.execute('SELECT id, fee, balance, cost_basis FROM traders WHERE username = ?',
+                                      (username,)).fetchone()
+        if row is None:
+            raise KeyError(f"No profile named {username} in {self.path}")
+        trader_id, fee, balance, cost_basis = row
+        from Trader import Trader
+        trader = Trader(username, fee, balance, cost_basis=cost_basis)
+        trader.owned = dict(self.connection.execute('SELECT symbol, amount FROM holdings WHERE trader_id = ?',
+                                                    (trader_id,)))
+        ledger = TradeLedger()
+        for record in self.connection.execute('SELECT symbol, amount, share_value, fee, time FROM trades '
+                                              'WHERE trader_id = ? ORDER BY seq', (trader_id,)):
+            ledger.add(*record)
+        trader.trades = ledger
+        trader.portfolio = Portfolio.from_ledger(ledger, cost_basis)
+        trader.stored_in = (self._key, len(ledger))
+        return trader
+
+    def delete(self, username):
+        with self.connection:
+            self.connection.execute('DELETE FROM traders WHERE username = ?', (username,))
+
+    def usernames(self):
+        return [row[0] for row in self.connection.execute('SELECT username FROM traders ORDER BY username')]
+
+    def _with_prices(self, prices):
+        self.connection.execute('CREATE TEMP TABLE IF NOT EXISTS prices (symbol TEXT PRIMARY KEY, price REAL)')
+        self.connection.execute('DELETE FROM prices')
+        self.connection.executemany('INSERT INTO prices VALUES (?, ?)', prices.items())
+
+    def leaderboard(self, prices=None, limit=10):
+        """(username, balance, net worth) by net worth; holdings without a price in `prices` count as 0."""
+        with self.connection:
+            self._with_prices(prices or {})
+            return self.connection.execute(
+                'SELECT t.username, t.balance, t.balance + COALESCE(SUM(h.amount * p.price), 0) AS net_worth '
+                'FROM traders t LEFT JOIN holdings h ON h.trader_id = t.id '
+                'LEFT JOIN prices p ON p.symbol = h.symbol '
+                'GROUP BY t.id ORDER BY net_worth DESC LIMIT ?', (limit,)).fetchall()
+
+    def exposure(self, symbol=None):
+        """(symbol, total amount held, number of holders) across all accounts."""
+        query = 'SELECT symbol, SUM(amount), COUNT(*) FROM holdings WHERE amount != 0'
+        if symbol is not None:
+            return self.connection.execute(query + ' AND symbol = ? GROUP BY symbol', (symbol,)).fetchall()
+        return self.connection.execute(query + ' GROUP BY symbol ORDER BY SUM(amount) DESC').fetchall()
+
+    def volume(self, symbol, start=None, end=None):
+        """(username, shares traded, trades) per account for `symbol` between two epoch times."""
+        return self.connection.execute(
+            'SELECT t.username, SUM(ABS(x.amount)), COUNT(*) FROM trades x JOIN traders t ON t.id = x.trader_id '
+            'WHERE x.symbol = ? AND x.time >= ? AND x.time < ? GROUP BY t.id ORDER BY 2 DESC',
+            (symbol, start if start is not None else float('-inf'), end if end is not None else float('inf'))
+        ).fetchall()
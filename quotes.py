@@ -0,0 +1,257 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+MAX_WORKERS = 8
+FETCH_TIMEOUT = 10  # seconds, per symbol
+
+
+class PriceProvider:
+    """Base class for anything the Trader can ask for a share price.
+
+    get_price returns the current price of a symbol as a float and raises KeyError
+    when the symbol is unknown to the provider (this mirrors yfinance's missing 'currentPrice').
+    Failing to reach the provider is not a KeyError: those errors propagate as they are.
+    """
+
+    def get_price(self, symbol: str) -> float:
+        raise NotImplementedError
+
+    def get_prices(self, symbols, max_workers: int = MAX_WORKERS, timeout: float = FETCH_TIMEOUT) -> dict:
+        """Fetch many symbols at once on a bounded thread pool.
+
+        Symbols that fail or don't answer within `timeout` seconds are left out of the result.
+        """
+        return fetch_concurrently(self.get_price, symbols, max_workers, timeout)
+
+
+class YahooPriceProvider(PriceProvider):
+    def get_price(self, symbol: str) -> float:
+        # yfinance (and pandas with it) is only imported on first use
+        import yfinance as yf
+        try:
+            # fast_info only reads the last trade, instead of the full fundamentals blob of get_info()
+            price = yf.Ticker(symbol).fast_info['lastPrice']
+        except KeyError:
+            # yfinance has no trading data for the symbol; network and HTTP errors propagate as they are
+            raise KeyError(symbol)
+        if price is None or price != price:  # missing or NaN
+            raise KeyError(symbol)
+        return float(price)
+
+
+class InMemoryPriceProvider(PriceProvider):
+    """Offline provider over a plain symbol -> price mapping (for tests and running without network)."""
+
+    def __init__(self, prices=None):
+        self.prices = dict(prices or {})
+
+    def set_price(self, symbol: str, price: float):
+        self.prices[symbol] = float(price)
+
+    def get_price(self, symbol: str) -> float:
+        return float(self.prices[symbol])
+
+    def get_prices(self, symbols, max_workers: int = MAX_WORKERS, timeout: float = FETCH_TIMEOUT) -> dict:
+        return {symbol: float(self.prices[symbol]) for symbol in symbols if symbol in self.prices}
+
+
+class CachedPriceProvider(PriceProvider):
+    """Wraps another provider with a bounded LRU cache whose entries go stale after `ttl` seconds."""
+
+    def __init__(self, provider: PriceProvider, ttl: float = 30, maxsize: int = 1024, clock=time.monotonic):
+        assert ttl >= 0 and maxsize > 0
+        self.provider = provider
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()  # symbol -> (price, fetched_at)
+        self._lock = threading.Lock()
+
+    def _lookup(self, symbol):
+        entry = self._cache.get(symbol)
+        if entry is None:
+            return None
+        price, fetched_at = entry
+        if self.clock() - fetched_at > self.ttl:
+            del self._cache[symbol]
+            return None
+        self._cache.move_to_end(symbol)
+        return price
+
+    def _store(self, symbol, price):
+        self._cache[symbol] = (price, self.clock())
+        self._cache.move_to_end(symbol)
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+
+    def get_price(self, symbol: str) -> float:
+        with self._lock:
+            price = self._lookup(symbol)
+            if price is not None:
+                self.hits += 1
+                metrics.incr('quotes.cache_hits')
+                return price
+            self.misses += 1
+        metrics.incr('quotes.cache_misses')
+        # fetch outside the lock so one slow symbol doesn't block the others
+        with metrics.span('quotes.fetch'):
+            price = self.provider.get_price(symbol)
+        with self._lock:
+            self._store(symbol, price)
+        return price
+
+    def get_prices(self, symbols, max_workers: int = MAX_WORKERS, timeout: float = FETCH_TIMEOUT) -> dict:
+        prices = {}
+        missing = []
+        with self._lock:
+            for symbol in dict.fromkeys(symbols):
+                price = self._lookup(symbol)
+                if price is None:
+                    self.misses += 1
+                    missing.append(symbol)
+                else:
+                    self.hits += 1
+                    prices[symbol] = price
+        metrics.incr('quotes.cache_hits', len(prices))
+        metrics.incr('quotes.cache_misses', len(missing))
+        if missing:
+            with metrics.span('quotes.batch_fetch'):
+                fetched = self.provider.get_prices(missing, max_workers, timeout)
+            metrics.incr('quotes.fetched', len(fetched))
+            metrics.incr('quotes.errors', len(missing) - len(fetched))
+            with self._lock:
+                for symbol, price in fetched.items():
+                    self._store(symbol, price)
+            prices.update(fetched)
+        return prices
+
+    def invalidate(self, symbol=None):
+        with self._lock:
+            if symbol is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(symbol, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._cache)}
+
+    def __len__(self):
+        return len(self._cache)
+
+
+class ValidatingPriceProvider(PriceProvider):
+    """Rejects symbols before they cost a request: unknown ones raise KeyError right away.
+
+    A symbol is unknown if it isn't in `universe` (by default every ticker in valid_tickers.csv, loaded
+    into a set on first use) or if the wrapped provider raised KeyError for it less than `negative_ttl`
+    seconds ago. Only KeyError counts as a rejection: network errors propagate and aren't remembered,
+    and neither are symbols a batch fetch leaves out, they may just have timed out.
+    Call refresh() after the universe file changes.
+    """
+
+    def __init__(self, provider: PriceProvider, universe=None, negative_ttl: float = 3600, maxsize: int = 4096,
+                 clock=time.monotonic):
+        self.provider = provider
+        self.negative_ttl = negative_ttl
+        self.maxsize = maxsize
+        self.clock = clock
+        self.rejected = 0
+        self._load_universe = universe is None
+        self._universe = None if universe is None else set(universe)
+        self._negative = OrderedDict()  # symbol -> time the upstream rejected it
+        self._lock = threading.Lock()
+
+    def refresh(self, universe=None):
+        """Reload the universe (or use `universe`) and forget the upstream rejections."""
+        if universe is None and self._load_universe:
+            from tickers import TickerIndex
+            # rebuilds the compiled index first when the csv changed
+            universe = TickerIndex.load(with_dots=True)
+        with self._lock:
+            if universe is not None:
+                self._universe = set(universe)
+            self._negative.clear()
+
+    def is_known(self, symbol: str) -> bool:
+        if self._universe is None:
+            self.refresh()
+        if symbol not in self._universe:
+            return False
+        with self._lock:
+            rejected_at = self._negative.get(symbol)
+            if rejected_at is None:
+                return True
+            if self.clock() - rejected_at > self.negative_ttl:
+                del self._negative[symbol]
+                return True
+            return False
+
+    def _reject(self, symbol):
+        with self._lock:
+            self._negative[symbol] = self.clock()
+            self._negative.move_to_end(symbol)
+            while len(self._negative) > self.maxsize:
+                self._negative.popitem(last=False)
+
+    def get_price(self, symbol: str) -> float:
+        if not self.is_known(symbol):
+            self.rejected += 1
+            metrics.incr('quotes.rejected')
+            raise KeyError(symbol)
+        try:
+            return self.provider.get_price(symbol)
+        except KeyError:
+            self._reject(symbol)
+            raise
+
+    def get_prices(self, symbols, max_workers: int = MAX_WORKERS, timeout: float = FETCH_TIMEOUT) -> dict:
+        symbols = list(dict.fromkeys(symbols))  # any iterable, walked once
+        known = [symbol for symbol in symbols if self.is_known(symbol)]
+        rejected = len(symbols) - len(known)
+        if rejected:
+            self.rejected += rejected
+            metrics.incr('quotes.rejected', rejected)
+        return self.provider.get_prices(known, max_workers, timeout) if known else {}
+
+    def stats(self) -> dict:
+        stats = self.provider.stats() if hasattr(self.provider, 'stats') else {}
+        with self._lock:
+            stats.update({'rejected': self.rejected, 'negative': len(self._negative)})
+        return stats
+
+
+def fetch_concurrently(fetch, symbols, max_workers: int = MAX_WORKERS, timeout: float = FETCH_TIMEOUT) -> dict:
+    symbols = list(dict.fromkeys(symbols))
+    if not symbols:
+        return {}
+    # imported here rather than at module load, it is the bulk of `import Trader` otherwise
+    from concurrent.futures import ThreadPoolExecutor, wait
+    max_workers = max(1, min(max_workers, len(symbols)))
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = {executor.submit(fetch, symbol): symbol for symbol in symbols}
+    # every worker handles ceil(n / workers) symbols in sequence, each one gets `timeout` seconds
+    done, _ = wait(futures, timeout=timeout * math.ceil(len(symbols) / max_workers))
+    # don't block on stragglers, they finish (and are dropped) in the background
+    executor.shutdown(wait=False, cancel_futures=True)
+    prices = {}
+    for future in done:
+        if future.exception() is None:
+            prices[futures[future]] = future.result()
+    return prices
+
+
+def default_price_provider() -> PriceProvider:
+    if os.environ.get('TRADINGSIM_SYNTHETIC'):
+        # TRADINGSIM_SYNTHETIC=<seed> runs everything offline against the synthetic market
+        from synthetic import SyntheticMarket, SyntheticPriceProvider
+        return CachedPriceProvider(SyntheticPriceProvider(SyntheticMarket(int(os.environ['TRADINGSIM_SYNTHETIC']))))
+    # symbols outside the ticker universe (or recently rejected by Yahoo) fail before any request is made
+    return ValidatingPriceProvider(CachedPriceProvider(YahooPriceProvider()))
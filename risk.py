@@ -0,0 +1,104 @@
+from collections import OrderedDict, namedtuple
+from statistics import NormalDist
+
+import numpy as np
+
+TRADING_DAYS = 252
+
+# money amounts are in the account's currency; var_* are the loss not exceeded with `confidence` over `horizon` days
+RiskReport = namedtuple('RiskReport', ['value', 'volatility', 'var_historical', 'var_parametric', 'max_drawdown',
+                                       'sharpe', 'confidence', 'horizon', 'missing'])
+
+
+def simple_returns(close):
+    """Day over day returns of a (dates x symbols) close matrix; days without a close on either side give 0."""
+    returns = close[1:] / close[:-1] - 1
+    return np.nan_to_num(returns, nan=0.0, posinf=0.0, neginf=0.0)
+
+
+def max_drawdown(values):
+    """Largest drop from a running peak, as a fraction of that peak (0.25 is a 25% drawdown)."""
+    values = np.asarray(values, dtype=np.float64)
+    if not len(values):
+        return 0.0
+    peaks = np.maximum.accumulate(values)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drawdowns = np.where(peaks > 0, 1 - values / peaks, 0.0)
+    return float(drawdowns.max())
+
+
+def sharpe_ratio(returns, risk_free: float = 0.0, periods: int = TRADING_DAYS):
+    """Annualized Sharpe ratio of per-period returns; `risk_free` is an annual rate."""
+    excess = np.asarray(returns) - risk_free / periods
+    deviation = excess.std(ddof=1) if len(excess) > 1 else 0.0
+    return float(excess.mean() / deviation * np.sqrt(periods)) if deviation else 0.0
+
+
+class RiskModel:
+    """Risk numbers for portfolios priced off one Bars history.
+
+    Returns are computed once for every symbol in the bars; covariance matrices of the held symbols are
+    cached (the last `cache_size` symbol sets), so re-running a report after a price refresh of the
+    same holdings is a matrix product rather than a new covariance estimate.
+    """
+
+    def __init__(self, bars, window: int = None, cache_size: int = 8):
+        self.bars = bars if window is None else bars.between(start=bars.dates[max(0, len(bars) - window - 1)])
+        self.closes = self.bars.filled_close()
+        self.returns = simple_returns(self.closes)
+        self.cache_size = cache_size
+        self._covariances = OrderedDict()
+
+    def covariance(self, symbols):
+        key = tuple(symbols)
+        covariance = self._covariances.get(key)
+        if covariance is None:
+            columns = [self.bars.columns[symbol] for symbol in symbols]
+            covariance = np.atleast_2d(np.cov(self.returns[:, columns], rowvar=False))
+            self._covariances[key] = covariance
+            if len(self._covariances) > self.cache_size:
+                self._covariances.popitem(last=False)
+        else:
+            self._covariances.move_to_end(key)
+        return covariance
+
+    def report(self, owned, balance: float = 0, confidence: float = 0.95, horizon: int = 1,
+               risk_free: float = 0.0):
+        """RiskReport for holdings {symbol: shares} (e.g. Trader.owned) plus `balance` in cash.
+
+        Positions are valued at their last close in the bars; held symbols the bars don't cover are
+        left out and listed in `missing`. VaR scales the one day numbers by sqrt(horizon).
+        """
+        held = {name: amount for name, amount in owned.items() if amount}
+        missing = [name for name in held if name not in self.bars.columns]
+        symbols = [name for name in held if name in self.bars.columns]
+        columns = [self.bars.columns[symbol] for symbol in symbols]
+        quantities = np.array([held[symbol] for symbol in symbols], dtype=np.float64)
+        closes = self.closes[:, columns]
+        last = np.nan_to_num(closes[-1]) if len(closes) else np.zeros(len(symbols))
+        exposure = quantities * last  # money in each position today
+        value = float(balance + exposure.sum())
+        if len(self.returns) < 2 or not len(symbols):
+            return RiskReport(value, 0.0, 0.0, 0.0, 0.0, 0.0, confidence, horizon, missing)
+
+        # profit and loss the current positions would have made on each past day, in money
+        pnl = self.returns[:, columns] @ exposure
+        scale = np.sqrt(horizon)
+        var_historical = max(0.0, -float(np.quantile(pnl, 1 - confidence))) * float(scale)
+        sigma = float(np.sqrt(max(exposure @ self.covariance(symbols) @ exposure, 0.0)))
+        z = NormalDist().inv_cdf(confidence)
+        # delta-normal, ignoring the drift (it is small next to sigma over short horizons)
+        var_parametric = float(z * sigma * scale)
+        # the current holdings (and cash) carried through the whole history
+        values = balance + np.nan_to_num(closes) @ quantities
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns = np.nan_to_num(np.diff(values) / values[:-1], nan=0.0, posinf=0.0, neginf=0.0)
+        volatility = float(sigma / value * np.sqrt(TRADING_DAYS)) if value else 0.0
+        return RiskReport(value, volatility, var_historical,
+                          var_parametric, max_drawdown(values), sharpe_ratio(returns, risk_free), confidence,
+                          horizon, missing)
+
+
+def portfolio_risk(trader, bars, confidence: float = 0.95, horizon: int = 1, window: int = None):
+    """One-off RiskReport for a Trader's holdings and balance; keep a RiskModel around to reuse its caches."""
+    return RiskModel(bars, window).report(trader.owned, trader.balance, confidence, horizon)
@@ -0,0 +1,169 @@
+import argparse
+import asyncio
+import glob
+import json
+import os
+
+from quotes import default_price_provider
+from Trader import Order, Trader, load_trader_from_file, store_trader_in_file
+
+
+class QuoteFetcher:
+    """Shared, deduplicating front for a price provider.
+
+    Concurrent requests for a symbol that is already being fetched wait on that fetch instead of
+    starting another one, and the symbols nobody is fetching yet go upstream in one batch.
+    """
+
+    def __init__(self, provider):
+        self.provider = provider
+        self.requested = 0  # symbols asked for
+        self.fetched = 0  # symbols actually sent to the provider
+        self._in_flight = dict()  # symbol -> future of its price (None when the provider doesn't know it)
+
+    async def get_prices(self, symbols) -> dict:
+        loop = asyncio.get_running_loop()
+        symbols = list(dict.fromkeys(symbols))
+        self.requested += len(symbols)
+        new = [symbol for symbol in symbols if symbol not in self._in_flight]
+        if new:
+            batch = loop.run_in_executor(None, self.provider.get_prices, new)
+            for symbol in new:
+                self._in_flight[symbol] = loop.create_task(self._price_of(batch, symbol))
+            self.fetched += len(new)
+        waiting = [self._in_flight[symbol] for symbol in symbols]
+        prices = await asyncio.gather(*waiting)
+        return {symbol: price for symbol, price in zip(symbols, prices) if price is not None}
+
+    async def _price_of(self, batch, symbol):
+        try:
+            return (await batch).get(symbol)
+        finally:
+            # done (or failed): the next request goes back to the provider (and its cache)
+            self._in_flight.pop(symbol, None)
+
+
+class TradingService:
+    """Many Trader accounts in one process, sharing one quote cache and fetcher.
+
+    Mutations of an account run under that account's lock, so its orders apply one at a time,
+    while different accounts trade concurrently.
+    """
+
+    def __init__(self, provider=None):
+        self.provider = provider if provider is not None else default_price_provider()
+        self.quotes = QuoteFetcher(self.provider)
+        self.accounts = dict()
+        self._locks = dict()
+
+    def add(self, trader):
+        trader.price_provider = self.provider
+        self.accounts[trader.username] = trader
+        self._locks[trader.username] = asyncio.Lock()
+        return trader
+
+    def open_account(self, username, fee: float = 0, balance: float = 0):
+        assert username not in self.accounts, f"Account {username} already exists"
+        return self.add(Trader(username, fee, balance, self.provider))
+
+    def load(self, path):
+        return self.add(load_trader_from_file(path))
+
+    def trader(self, username):
+        if username not in self.accounts:
+            raise KeyError(f"No account named {username}")
+        return self.accounts[username]
+
+    async def order(self, username, orders):
+        trader = self.trader(username)
+        orders = [order if isinstance(order, Order) else Order(*order) for order in orders]
+        prices = await self.quotes.get_prices(order.stock_name for order in orders)
+        async with self._locks[username]:
+            fills = trader.execute_batch(orders, prices)
+        return [{'symbol': fill.name, 'amount': fill.amount, 'share_value': fill.share_value} for fill in fills]
+
+    async def deposit(self, username, money: float):
+        trader = self.trader(username)
+        async with self._locks[username]:
+            trader.add_money(money)
+        return trader.balance
+
+    async def value(self, username):
+        trader = self.trader(username)
+        held = {name: amount for name, amount in trader.owned.items() if amount}
+        prices = await self.quotes.get_prices(held)
+        positions = {name: amount * prices[name] for name, amount in held.items() if name in prices}
+        return {'balance': trader.balance, 'net_worth': trader.balance + sum(positions.values()),
+                'positions': positions, 'missing': [name for name in held if name not in prices]}
+
+    async def save(self, username, path):
+        trader = self.trader(username)
+        async with self._locks[username]:
+            await asyncio.get_running_loop().run_in_executor(None, store_trader_in_file, trader, path)
+        return path
+
+    def stats(self):
+        stats = {'accounts': len(self.accounts), 'requested': self.quotes.requested, 'fetched': self.quotes.fetched}
+        if hasattr(self.provider, 'stats'):
+            stats.update(self.provider.stats())
+        return stats
+
+    async def handle(self, request):
+        """Serve one request dict: {"op": ..., arguments...} -> {"ok": true, "result": ...} or an error."""
+        op = request.get('op')
+        try:
+            if op == 'open':
+                self.open_account(request['username'], request.get('fee', 0), request.get('balance', 0))
+                result = request['username']
+            elif op == 'order':
+                orders = [Order(o['side'], o['symbol'], o.get('amount'), o.get('value')) for o in request['orders']]
+                result = await self.order(request['username'], orders)
+            elif op == 'deposit':
+                result = await self.deposit(request['username'], request['value'])
+            elif op == 'value':
+                result = await self.value(request['username'])
+            elif op == 'save':
+                result = await self.save(request['username'], request['path'])
+            elif op == 'stats':
+                result = self.stats()
+            else:
+                raise ValueError(f"Unknown op {op!r}")
+        except Exception as e:
+            return {'ok': False, 'error': str(e) or type(e).__name__}
+        return {'ok': True, 'result': result}
+
+    async def _serve_client(self, reader, writer):
+        # one json request per line, answered in order with one json response per line
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    response = {'ok': False, 'error': "Request is not valid json"}
+                else:
+                    response = await self.handle(request)
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8765):
+        server = await asyncio.start_server(self._serve_client, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve many trading accounts over local json-lines TCP")
+    parser.add_argument('--profiles', help="directory of .pickle/.journal profiles to load")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    service = TradingService()
+    if args.profiles:
+        for path in glob.glob(os.path.join(args.profiles, '*.pickle')) + \
+                glob.glob(os.path.join(args.profiles, '*.journal')):
+            service.load(path)
+    print(f"Serving {len(service.accounts)} accounts on {args.host}:{args.port}")
+    asyncio.run(service.serve(args.host, args.port))
@@ -0,0 +1,148 @@
+import math
+import random
+import threading
+import time
+
+
+class QuoteStream:
+    """Fan-out of price ticks: feeds publish, subscribers get called with (symbol, price) for their symbols."""
+
+    def __init__(self):
+        self._subscribers = dict()  # symbol -> tuple of callbacks
+        self._lock = threading.Lock()
+        self.last = dict()  # symbol -> last published price
+
+    def subscribe(self, symbols, callback):
+        # callback lists are replaced, never changed in place, so publish can iterate them without the lock
+        with self._lock:
+            for symbol in symbols:
+                callbacks = self._subscribers.get(symbol, ())
+                if callback not in callbacks:
+                    self._subscribers[symbol] = (*callbacks, callback)
+
+    def unsubscribe(self, callback, symbols=None):
+        with self._lock:
+            for symbol in list(self._subscribers if symbols is None else symbols):
+                callbacks = tuple(c for c in self._subscribers.get(symbol, ()) if c != callback)
+                if callbacks:
+                    self._subscribers[symbol] = callbacks
+                else:
+                    self._subscribers.pop(symbol, None)
+
+    def symbols(self):
+        with self._lock:
+            return list(self._subscribers)
+
+    def publish(self, symbol, price):
+        self.last[symbol] = price
+        for callback in self._subscribers.get(symbol, ()):
+            callback(symbol, price)
+
+
+class SimulatedFeed:
+    """Stand-in for a live feed: random-walk ticks for whatever symbols the stream has subscribers for."""
+
+    def __init__(self, stream, rate: float = 1000, volatility: float = 0.0005, start_prices=None, seed=None):
+        self.stream = stream
+        self.rate = rate  # ticks per second, across all symbols
+        self.volatility = volatility  # per tick
+        self.prices = dict(start_prices or {})
+        self.published = 0
+        self._random = random.Random(seed)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='simulated-feed', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def tick(self, symbol):
+        # the stream's last price first: a LivePortfolio resync puts the real valuation there
+        price = self.stream.last.get(symbol) or self.prices.get(symbol) or 100.0
+        price *= math.exp(self._random.gauss(0, self.volatility))
+        self.prices[symbol] = price
+        self.stream.publish(symbol, price)
+        self.published += 1
+
+    def _run(self):
+        batch = max(1, int(self.rate / 100))  # publish in bursts, ~100 per second
+        while not self._stop.is_set():
+            start = time.perf_counter()
+            symbols = self.stream.symbols()
+            if symbols:
+                for _ in range(batch):
+                    self.tick(self._random.choice(symbols))
+            self._stop.wait(max(0.0, batch / self.rate - (time.perf_counter() - start)))
+
+
+class LivePortfolio:
+    """Net worth kept current from ticks: each tick moves it by quantity * price change, O(1).
+
+    Call resync with fresh holdings (and prices, if known) after fills; the prices are also made the
+    stream's last prices. Readers poll `version` to notice changes, which lets a GUI redraw at its own
+    pace instead of once per tick.
+    """
+
+    def __init__(self, stream, balance: float = 0, owned=None, prices=None):
+        self.stream = stream
+        self.balance = balance
+        self.quantities = dict()
+        self.prices = dict()
+        self.positions_value = 0.0
+        self.version = 0
+        self.ticks = 0
+        self._lock = threading.Lock()
+        self.resync(balance, owned or {}, prices or {})
+
+    @property
+    def net_worth(self):
+        return self.balance + self.positions_value
+
+    def resync(self, balance, owned, prices=None):
+        """Start over from a holdings snapshot (e.g. after an order filled); O(number of positions)."""
+        held = {name: amount for name, amount in owned.items() if amount}
+        with self._lock:
+            dropped = [name for name in self.quantities if name not in held]
+            self.balance = balance
+            self.quantities = held
+            for name in held:
+                price = (prices or {}).get(name, self.prices.get(name, self.stream.last.get(name)))
+                if price is not None:
+                    self.prices[name] = price
+                if prices and name in prices:
+                    # so feeds (e.g. SimulatedFeed) carry on from the fresh valuation rather than their own walk
+                    self.stream.last[name] = prices[name]
+            self.positions_value = sum(amount * self.prices[name] for name, amount in held.items()
+                                       if name in self.prices)
+            self.version += 1
+        self.stream.unsubscribe(self.on_tick, dropped)
+        self.stream.subscribe(list(held), self.on_tick)
+
+    def on_tick(self, symbol, price):
+        with self._lock:
+            quantity = self.quantities.get(symbol)
+            if quantity is None:
+                return
+            self.positions_value += quantity * (price - self.prices.get(symbol, 0.0))
+            self.prices[symbol] = price
+            self.ticks += 1
+            self.version += 1
+
+    def position_value(self, symbol):
+        with self._lock:
+            return self.quantities.get(symbol, 0) * self.prices.get(symbol, 0.0)
+
+    def missing(self):
+        """Held symbols with no price yet (they count as 0 until their first tick)."""
+        with self._lock:
+            return [name for name in self.quantities if name not in self.prices]
+
+    def close(self):
+        self.stream.unsubscribe(self.on_tick)
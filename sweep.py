@@ -0,0 +1,103 @@
+import argparse
+import csv
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from backtest import FIELDS, Bars, MovingAverageCrossover, load_bars, run_backtest
+
+# set in each worker process by _attach_bars
+_bars = None
+_shm = None
+
+
+def grid(**params):
+    """Every combination of the given parameter lists, as dicts: grid(fee=[0, .01], fast=[10, 20]) -> 4 dicts."""
+    names = list(params)
+    return [dict(zip(names, values)) for values in itertools.product(*params.values())]
+
+
+def share_bars(bars):
+    """Copy the bar matrices into one shared memory block; returns (block, spec to attach with)."""
+    shape = (len(FIELDS), len(bars), len(bars.symbols))
+    block = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * 8))
+    matrices = np.ndarray(shape, dtype=np.float64, buffer=block.buf)
+    for i, field in enumerate(FIELDS):
+        matrices[i] = getattr(bars, field)
+    return block, (block.name, shape, bars.symbols, bars.dates)
+
+
+def _attach_bars(spec):
+    global _bars, _shm
+    name, shape, symbols, dates = spec
+    # workers share the parent's resource tracker, so the block is still unlinked exactly once (by the parent)
+    _shm = shared_memory.SharedMemory(name=name)
+    matrices = np.ndarray(shape, dtype=np.float64, buffer=_shm.buf)
+    _bars = Bars(symbols, dates, *matrices)
+
+
+def _run_one(task):
+    strategy_cls, params, initial_balance = task
+    params = dict(params)
+    fee = params.pop('fee', 0)
+    result = run_backtest(_bars, strategy_cls(**params), initial_balance, fee)
+    trader = result.trader
+    return {'final_balance': trader.balance,
+            'net_worth': float(result.equity[-1]) if len(result.equity) else trader.balance,
+            'trades': len(trader.trades),
+            'fees': trader.portfolio.fees,
+            'realized': trader.portfolio.realized}
+
+
+def run_sweep(bars, strategy_cls, configs, initial_balance: float = 10000, max_workers: int = None):
+    """Backtest `strategy_cls(**config)` for every config on a process pool.
+
+    A 'fee' key in a config is passed to the Trader instead of the strategy. The bars go to the
+    workers once, through shared memory, instead of being pickled with every task.
+    Returns one row (config plus results) per config, in config order.
+    """
+    block, spec = share_bars(bars)
+    try:
+        max_workers = max_workers or os.cpu_count()
+        chunksize = max(1, len(configs) // (4 * max_workers))
+        tasks = [(strategy_cls, config, initial_balance) for config in configs]
+        with ProcessPoolExecutor(max_workers, initializer=_attach_bars, initargs=(spec,)) as pool:
+            results = list(pool.map(_run_one, tasks, chunksize=chunksize))
+    finally:
+        block.close()
+        block.unlink()
+    return [{**config, **result} for config, result in zip(configs, results)]
+
+
+def write_table(rows, path):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def _numbers(text, kind=float):
+    return [kind(value) for value in text.split(',')]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Moving average crossover parameter sweep over local bars")
+    parser.add_argument('bars', help="directory of <SYMBOL>.csv daily bars")
+    parser.add_argument('--fast', type=lambda text: _numbers(text, int), default=[10, 20])
+    parser.add_argument('--slow', type=lambda text: _numbers(text, int), default=[50, 100])
+    parser.add_argument('--stake', type=_numbers, default=[0.1])
+    parser.add_argument('--fee', type=_numbers, default=[0, 0.001])
+    parser.add_argument('--balance', type=float, default=10000)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--out', default='sweep_results.csv')
+    args = parser.parse_args()
+
+    configs = [config for config in grid(fast=args.fast, slow=args.slow, stake=args.stake, fee=args.fee)
+               if config['fast'] < config['slow']]
+    rows = run_sweep(load_bars(args.bars), MovingAverageCrossover, configs, args.balance, args.workers)
+    write_table(rows, args.out)
+    best = max(rows, key=lambda row: row['net_worth'])
+    print(f"{len(rows)} configurations written to {args.out}, best: {best}")
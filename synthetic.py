@@ -0,0 +1,215 @@
+"""Deterministic synthetic market, an offline stand-in for Yahoo.
+
+Every symbol gets its own random stream derived from (seed, symbol), so the same seed always gives
+the same prices, whichever symbols are asked for and in whatever order:
+
+    market = SyntheticMarket(seed=7)
+    market.price('AAPL')                    # the price right now (it moves every TICK_SECONDS)
+    dates, values = market.history('AAPL', 250)
+    provider = SyntheticPriceProvider(market, latency=0.05, error_rate=0.01)
+    symbols, prices = market.ticks(['AAPL', 'MSFT'], 1_000_000)
+"""
+import datetime
+import random
+import time
+import zlib
+
+import numpy as np
+
+from quotes import FETCH_TIMEOUT, MAX_WORKERS, PriceProvider
+
+# daily closes are generated in blocks of this many days, each block from its own stream
+BLOCK_DAYS = 1024
+EPOCH = np.datetime64('2000-01-03', 'D')
+# quoted prices change once per this many seconds
+TICK_SECONDS = 1
+
+
+def _symbol_key(symbol):
+    return zlib.crc32(symbol.encode('utf-8'))
+
+
+class SyntheticMarket:
+    """Seeded price series for any symbol: a daily geometric random walk plus intraday noise.
+
+    Each symbol draws its starting price, drift and volatility from its own stream. Daily closes are
+    generated lazily (in blocks, and cached), intraday prices wobble around the last close with noise
+    that is a pure function of (seed, symbol, time), so a price can be asked for at any moment.
+    `universe` restricts the symbols that exist (by default everything in valid_tickers.csv); pass
+    universe=None to make up any symbol asked for.
+    """
+
+    def __init__(self, seed: int = 0, universe=(), clock=time.time):
+        self.seed = seed
+        self.clock = clock
+        if universe == ():
+            from tickers import TickerIndex
+            universe = TickerIndex.load(with_dots=True)
+        self.universe = universe
+        self._params = dict()  # symbol -> (start price, daily drift, daily volatility)
+        self._closes = dict()  # symbol -> daily closes generated so far, from EPOCH on
+
+    def __contains__(self, symbol):
+        return self.universe is None or symbol in self.universe
+
+    def _rng(self, symbol, *stream):
+        return np.random.default_rng([self.seed, _symbol_key(symbol), *stream])
+
+    def params(self, symbol):
+        params = self._params.get(symbol)
+        if params is None:
+            if symbol not in self:
+                raise KeyError(symbol)
+            rng = self._rng(symbol, 0)
+            # start prices spread log-uniformly over $2 - $500, annual drift -5%..+15%, volatility 15%..60%
+            params = self._params[symbol] = (float(np.exp(rng.uniform(np.log(2), np.log(500)))),
+                                             rng.uniform(-0.05, 0.15) / 252,
+                                             rng.uniform(0.15, 0.6) / np.sqrt(252))
+        return params
+
+    def closes(self, symbol, days: int):
+        """The first `days` daily closes of `symbol`, counting from EPOCH."""
+        closes = self._closes.get(symbol)
+        if closes is None or len(closes) < days:
+            start, drift, volatility = self.params(symbol)
+            blocks = [] if closes is None else [closes]
+            have = 0 if closes is None else len(closes)
+            last = start if closes is None else closes[-1]
+            while have < days:
+                steps = self._rng(symbol, 1, have // BLOCK_DAYS).normal(drift - volatility ** 2 / 2, volatility,
+                                                                      BLOCK_DAYS)
+                block = last * np.exp(np.cumsum(steps))
+                blocks.append(block)
+                have += BLOCK_DAYS
+                last = block[-1]
+            closes = self._closes[symbol] = np.concatenate(blocks)
+        return closes[:days]
+
+    def close(self, symbol, day):
+        """Close of `symbol` on `day` (a date, or a datetime64[D])."""
+        index = int((np.datetime64(day, 'D') - EPOCH).astype(np.int64))
+        assert index >= 0, f"synthetic prices start on {EPOCH}"
+        return float(self.closes(symbol, index + 1)[index])
+
+    def price(self, symbol, when=None):
+        """Quoted price at epoch time `when` (default: now): the previous close plus intraday noise."""
+        when = self.clock() if when is None else when
+        day = np.datetime64(int(when // 86400), 'D')
+        previous = self.close(symbol, day - 1)
+        _, _, volatility = self.params(symbol)
+        # how far into the day we are sets how far the price may have wandered from the previous close
+        elapsed = (when % 86400) / 86400
+        tick = int(when // TICK_SECONDS)
+        noise = self._rng(symbol, 2, tick).standard_normal()
+        return float(previous * np.exp(volatility * np.sqrt(elapsed) * noise))
+
+    def history(self, symbol, days: int, end=None):
+        """The `days` daily bars up to (not including) `end` (default: today), as (dates, values[n x 5]).
+
+        Same shape as backtest.read_bars_csv, so it plugs into align_bars and PriceStore.append.
+        """
+        end = np.datetime64(datetime.date.today() if end is None else end, 'D')
+        last = int((end - EPOCH).astype(np.int64))
+        first = max(0, last - days)
+        closes = self.closes(symbol, last)
+        close = closes[first:last]
+        opens = np.concatenate([closes[first - 1:first] if first else close[:1], close[:-1]])
+        rng = self._rng(symbol, 3, first, last)
+        _, _, volatility = self.params(symbol)
+        spread = np.abs(rng.normal(0, volatility, (2, len(close))))
+        high = np.maximum(opens, close) * np.exp(spread[0])
+        low = np.minimum(opens, close) * np.exp(-spread[1])
+        volume = np.round(rng.lognormal(13, 1, len(close)))
+        dates = EPOCH + np.arange(first, last)
+        return dates, np.column_stack([opens, high, low, close, volume])
+
+    def bars(self, symbols, days: int, end=None):
+        from backtest import align_bars
+        return align_bars(list(symbols), [self.history(symbol, days, end) for symbol in symbols])
+
+    def ticks(self, symbols, count: int, volatility: float = 0.0005, seed: int = 0, prices=None):
+        """`count` ticks spread randomly over `symbols`, as (symbol index per tick, price per tick).
+
+        Each symbol walks from its current price (or prices[symbol]) by log-normal steps, generated
+        for all ticks at once: sorting the ticks by symbol turns every symbol's walk into one
+        segment of a single cumulative sum.
+        """
+        rng = self._rng('', 4, seed, count)
+        start = np.array([prices[symbol] if prices and symbol in prices else self.price(symbol)
+                          for symbol in symbols])
+        which = rng.integers(len(symbols), size=count)
+        steps = rng.normal(0, volatility, count)
+        order = np.argsort(which, kind='stable')
+        walked = np.cumsum(steps[order])
+        counts = np.bincount(which, minlength=len(symbols))
+        starts = np.cumsum(counts) - counts
+        # subtract what the symbols sorted before it summed to, so each walk starts over from 0
+        base = np.where(starts > 0, walked[np.maximum(starts - 1, 0)], 0.0) if count else np.zeros(len(symbols))
+        group_start = np.repeat(base, counts)
+        result = np.empty(count)
+        result[order] = start[which[order]] * np.exp(walked - group_start)
+        return which, result
+
+    def ticker(self, symbol):
+        return SyntheticTicker(self, symbol)
+
+
+class SyntheticTicker:
+    """Answers the parts of yfinance's Ticker the simulator uses: get_info(), fast_info and history."""
+
+    def __init__(self, market, symbol):
+        self.market = market
+        self.symbol = symbol
+
+    def get_info(self):
+        # an unknown symbol gives an info dict without currentPrice, like Yahoo does
+        if self.symbol not in self.market:
+            return {'trailingPegRatio': None}
+        price = self.market.price(self.symbol)
+        return {'symbol': self.symbol, 'currency': 'USD', 'currentPrice': price, 'regularMarketPrice': price,
+                'previousClose': self.market.close(self.symbol, datetime.date.today() - datetime.timedelta(days=1))}
+
+    @property
+    def fast_info(self):
+        if self.symbol not in self.market:
+            return {'lastPrice': None}
+        return {'lastPrice': self.market.price(self.symbol), 'currency': 'USD'}
+
+    def history(self, days: int = 30):
+        return self.market.history(self.symbol, days)
+
+
+class SyntheticPriceProvider(PriceProvider):
+    """PriceProvider over a SyntheticMarket that behaves like a remote service.
+
+    Every request waits `latency` seconds (plus up to `jitter` more) and fails with ConnectionError
+    at `error_rate`; both are drawn from a stream seeded with `seed`, so a run is repeatable when
+    requests are made in the same order. Unknown symbols raise KeyError, like YahooPriceProvider.
+    """
+
+    def __init__(self, market: SyntheticMarket = None, latency: float = 0, jitter: float = 0,
+                 error_rate: float = 0, seed: int = 0):
+        self.market = market if market is not None else SyntheticMarket()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+
+    def get_price(self, symbol: str) -> float:
+        self.requests += 1
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+        failed = self.error_rate and self._random.random() < self.error_rate
+        if delay:
+            time.sleep(delay)
+        if failed:
+            self.errors += 1
+            raise ConnectionError(f"synthetic upstream error for {symbol}")
+        return self.market.price(symbol)
+
+    def get_prices(self, symbols, max_workers: int = MAX_WORKERS, timeout: float = FETCH_TIMEOUT) -> dict:
+        if not self.latency and not self.jitter and not self.error_rate:
+            # nothing to wait for, skip the thread pool
+            return {symbol: self.market.price(symbol) for symbol in dict.fromkeys(symbols) if symbol in self.market}
+        return super().get_prices(symbols, max_workers, timeout)
@@ -0,0 +1,44 @@
+import datetime
+import itertools
+import os
+
+from journal import CHECKPOINT_SUFFIX, SEGMENT_SUFFIX, load_journaled_trader, store_journaled_trader
+from quotes import InMemoryPriceProvider
+from Trader import Trader
+
+
+def make_trader(provider):
+    trader = Trader('test', 0, 1e9, provider)
+    ticks = itertools.count(1_700_000_000)
+    trader.clock = lambda: datetime.datetime.fromtimestamp(next(ticks))
+    return trader
+
+
+def state(trader):
+    return trader.balance, trader.owned, list(trader.trades.records()), trader.portfolio.realized
+
+
+def test_snapshots_only_append_the_new_trades(tmp_path):
+    provider = InMemoryPriceProvider({'AAPL': 10.0, 'MSFT': 20.0})
+    path = str(tmp_path / 'test.journal')
+    trader = make_trader(provider)
+    store_journaled_trader(trader, path, snapshot_every=10)
+    for i in range(95):
+        trader.buy('AAPL' if i % 2 else 'MSFT', 10)
+    trader.sell('AAPL', amount=1)
+    checkpoint_size = os.path.getsize(path + CHECKPOINT_SUFFIX)
+    segment_size = os.path.getsize(path + SEGMENT_SUFFIX)
+    for i in range(50):
+        trader.buy('AAPL', 10)
+        trader.sell('AAPL', amount=1)
+    trader.journal.close()
+    # the trades go to the end of the .trades sidecar, the checkpoint doesn't grow with them
+    assert os.path.getsize(path + SEGMENT_SUFFIX) > segment_size
+    assert os.path.getsize(path + CHECKPOINT_SUFFIX) < checkpoint_size + 200
+
+    loaded = load_journaled_trader(path)
+    assert state(loaded) == state(trader)
+    loaded.price_provider = provider
+    loaded.buy('MSFT', 10)
+    loaded.journal.close()
+    assert state(load_journaled_trader(path)) == state(loaded)
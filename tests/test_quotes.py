@@ -0,0 +1,59 @@
+import sys
+import types
+
+import pytest
+
+from quotes import CachedPriceProvider, InMemoryPriceProvider, ValidatingPriceProvider, YahooPriceProvider
+from Trader import Trader
+
+
+class FakeTicker:
+    # what the stub yfinance answers: a price, None (no trading data) or an exception to raise
+    answers = {}
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+
+    @property
+    def fast_info(self):
+        answer = self.answers[self.symbol]
+        if isinstance(answer, Exception):
+            raise answer
+        return {'lastPrice': answer}
+
+
+@pytest.fixture
+def trader(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'yfinance', types.SimpleNamespace(Ticker=FakeTicker))
+    FakeTicker.answers = {}
+    provider = ValidatingPriceProvider(CachedPriceProvider(YahooPriceProvider(), ttl=0), universe={'AAPL', 'GONE'})
+    return Trader('test', 0, 1000, provider)
+
+
+def test_network_error_is_not_remembered_as_invalid_symbol(trader):
+    FakeTicker.answers['AAPL'] = ConnectionError("network is down")
+    with pytest.raises(ConnectionError):
+        trader.buy('AAPL', 10)
+    # the network comes back: the symbol must not have been negative cached
+    FakeTicker.answers['AAPL'] = 100.0
+    trader.buy('AAPL', 10)
+    assert trader.owned == {'AAPL': 0.1}
+    assert trader.price_provider.stats()['negative'] == 0
+
+
+def test_symbol_without_price_is_rejected_without_asking_again(trader):
+    FakeTicker.answers['GONE'] = None
+    with pytest.raises(ValueError):
+        trader.buy('GONE', 10)
+    FakeTicker.answers['GONE'] = AssertionError("upstream asked again")
+    with pytest.raises(ValueError):
+        trader.buy('GONE', 10)
+    with pytest.raises(ValueError):
+        trader.buy('TYPO', 10)
+    assert trader.price_provider.stats()['negative'] == 1
+
+
+def test_get_prices_accepts_a_generator():
+    provider = ValidatingPriceProvider(InMemoryPriceProvider({'A': 1.0, 'B': 2.0}), universe={'A', 'B'})
+    assert provider.get_prices(symbol for symbol in ['A', 'B', 'ZZ']) == {'A': 1.0, 'B': 2.0}
+    assert provider.stats()['rejected'] == 1
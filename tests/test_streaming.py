@@ -0,0 +1,17 @@
+from streaming import LivePortfolio, QuoteStream, SimulatedFeed
+
+
+def test_simulated_feed_walks_from_the_resynced_prices():
+    stream = QuoteStream()
+    live = LivePortfolio(stream)
+    feed = SimulatedFeed(stream, volatility=0.0005, seed=1)
+    live.resync(1000, {'AAPL': 10}, {'AAPL': 190.0})
+    assert live.net_worth == 2900
+    for _ in range(1000):
+        feed.tick('AAPL')
+    # 1000 ticks of 0.05% stay within a few percent of 190, nowhere near the feed's default of 100
+    assert abs(live.net_worth - 2900) < 200
+    # a refresh moves the feed on to the new valuation
+    live.resync(1000, {'AAPL': 10}, {'AAPL': 200.0})
+    feed.tick('AAPL')
+    assert abs(live.net_worth - 3000) < 10
@@ -0,0 +1,129 @@
+import mmap
+import os
+import struct
+from bisect import bisect_left
+
+TICKERS_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'valid_tickers.csv')
+
+# magic, csv mtime (ns), csv size, symbol count, blob size
+_HEADER = struct.Struct('<8sqqII')
+_MAGIC = b'TICKIDX1'
+
+
+def parse_tickers(csv_path=TICKERS_CSV, with_dots=False):
+    # rows look like "('AAPL', datetime.date(2023, 7, 15), 'USD', ...)", the first line is the header
+    tickers = []
+    with open(csv_path, encoding='utf-8') as f:
+        next(f, None)
+        for line in f:
+            if not line.startswith("('"):
+                continue
+            symbol = line[2:line.index("'", 2)]
+            if with_dots or '.' not in symbol:
+                tickers.append(symbol)
+    return sorted(set(tickers))
+
+
+def index_path_for(csv_path, with_dots=False):
+    root, _ = os.path.splitext(csv_path)
+    return root + ('.idx' if with_dots else '.nodots.idx')
+
+
+class TickerIndex:
+    """Sorted ticker symbols, compiled once into a binary file and memory mapped afterwards.
+
+    File layout: header, (count + 1) uint32 offsets, then all symbols back to back as ascii. Where the
+    file can't be written, load() keeps the same bytes in memory instead.
+    Only the header is read on load; symbols are decoded on demand, and prefix search is a bisect
+    over the offsets, so neither load time nor lookups depend on the size of the universe.
+    """
+
+    def __init__(self, buffer, count):
+        self._buffer = buffer
+        self._count = count
+        self._offsets = memoryview(buffer)[_HEADER.size:_HEADER.size + 4 * (count + 1)].cast('I')
+        self._blob_start = _HEADER.size + 4 * (count + 1)
+
+    @classmethod
+    def load(cls, csv_path=TICKERS_CSV, with_dots=False, index_path=None):
+        """Open the compiled index, (re)building it first if it is missing or older than the csv."""
+        index_path = index_path or index_path_for(csv_path, with_dots)
+        stat = os.stat(csv_path)
+        try:
+            return cls.open(index_path, stat.st_mtime_ns, stat.st_size)
+        except (OSError, ValueError):
+            symbols = parse_tickers(csv_path, with_dots)
+        try:
+            cls.compile(symbols, index_path, stat.st_mtime_ns, stat.st_size)
+            return cls.open(index_path, stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            # nowhere to write the index (e.g. a read-only checkout): keep the compiled bytes in memory
+            return cls.from_symbols(symbols)
+
+    @classmethod
+    def open(cls, index_path, csv_mtime=None, csv_size=None):
+        with open(index_path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(buffer) < _HEADER.size:
+            raise ValueError(f"{index_path} is not a ticker index")
+        magic, mtime, size, count, blob_size = _HEADER.unpack_from(buffer)
+        if magic != _MAGIC or len(buffer) != _HEADER.size + 4 * (count + 1) + blob_size:
+            raise ValueError(f"{index_path} is not a ticker index")
+        if (csv_mtime is not None and mtime != csv_mtime) or (csv_size is not None and size != csv_size):
+            raise ValueError(f"{index_path} is out of date")
+        return cls(buffer, count)
+
+    @classmethod
+    def from_symbols(cls, symbols):
+        """An index over `symbols` held in memory, in the same layout as the compiled file."""
+        buffer = cls._build(symbols)
+        return cls(buffer, _HEADER.unpack_from(buffer)[3])
+
+    @staticmethod
+    def _build(symbols, csv_mtime=0, csv_size=0):
+        symbols = sorted(set(symbols))
+        offsets = [0]
+        for symbol in symbols:
+            offsets.append(offsets[-1] + len(symbol.encode('ascii')))
+        blob = ''.join(symbols).encode('ascii')
+        return (_HEADER.pack(_MAGIC, csv_mtime, csv_size, len(symbols), len(blob))
+                + struct.pack(f'<{len(offsets)}I', *offsets) + blob)
+
+    @staticmethod
+    def compile(symbols, index_path, csv_mtime=0, csv_size=0):
+        buffer = TickerIndex._build(symbols, csv_mtime, csv_size)
+        tmp_path = index_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(buffer)
+        # replace in one step so a crash never leaves a half written index behind
+        os.replace(tmp_path, index_path)
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._count))]
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        start = self._blob_start + self._offsets[i]
+        end = self._blob_start + self._offsets[i + 1]
+        return self._buffer[start:end].decode('ascii')
+
+    def __contains__(self, symbol):
+        i = bisect_left(self, symbol)
+        return i < self._count and self[i] == symbol
+
+    def prefix(self, prefix: str, limit: int = None):
+        """Symbols starting with `prefix`, in sorted order (at most `limit` of them)."""
+        result = []
+        i = bisect_left(self, prefix)
+        while i < self._count and (limit is None or len(result) < limit):
+            symbol = self[i]
+            if not symbol.startswith(prefix):
+                break
+            result.append(symbol)
+            i += 1
+        return result
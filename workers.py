@@ -0,0 +1,130 @@
+import logging
+import time
+from itertools import count
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal, pyqtSlot
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# how long a single result handler may hold the GUI thread before it is counted as over budget
+UI_BLOCK_BUDGET_MS = 50
+
+
+class Job(QRunnable):
+    def __init__(self, runner, job_id, fn, args, kwargs):
+        super().__init__()
+        self.runner = runner
+        self.job_id = job_id
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+
+    def run(self):
+        try:
+            result = self.fn(*self.args, **self.kwargs)
+        except Exception as e:
+            self.runner.failed.emit(self.job_id, e)
+        else:
+            self.runner.finished.emit(self.job_id, result)
+
+
+class JobRunner(QObject):
+    """Runs trader work (orders, valuations, saves) on a background thread.
+
+    Jobs run one at a time and in submission order, so they never touch the same Trader concurrently
+    and a refresh queued after an order sees that order's fill. Results come back to the GUI thread
+    through queued signals, where the callbacks are timed against UI_BLOCK_BUDGET_MS.
+    Work that never touches a Trader (e.g. loading the ticker index) can go through submit_background
+    instead, so it neither waits behind nor delays the trader jobs.
+    """
+    finished = pyqtSignal(int, object)
+    failed = pyqtSignal(int, object)
+
+    def __init__(self, parent=None, budget_ms: float = UI_BLOCK_BUDGET_MS):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self.background = QThreadPool.globalInstance()
+        self.budget_ms = budget_ms
+        self.last_block_ms = 0.0
+        self.max_block_ms = 0.0
+        self.over_budget = 0
+        self._ids = count()
+        self._callbacks = dict()
+        self._refresh_running = False
+        self._refresh_pending = False
+        self._refresh_args = None
+        # the runner lives on the GUI thread, so these slots are called there (queued)
+        self.finished.connect(self._on_finished)
+        self.failed.connect(self._on_failed)
+
+    def submit(self, fn, *args, on_done=None, on_error=None, **kwargs):
+        job_id = next(self._ids)
+        self._callbacks[job_id] = (on_done, on_error)
+        self.pool.start(Job(self, job_id, fn, args, kwargs))
+        return job_id
+
+    def submit_background(self, fn, *args, on_done=None, on_error=None, **kwargs):
+        """Like submit, but on the shared pool: runs alongside the trader jobs, in no particular order."""
+        job_id = next(self._ids)
+        self._callbacks[job_id] = (on_done, on_error)
+        self.background.start(Job(self, job_id, fn, args, kwargs))
+        return job_id
+
+    def submit_refresh(self, fn, on_done, on_error=None):
+        """Like submit, but requests made while a refresh is already queued or running collapse into one."""
+        self._refresh_args = (fn, on_done, on_error)
+        if self._refresh_running:
+            self._refresh_pending = True
+            return
+        self._refresh_running = True
+
+        def done(result):
+            self._refresh_finished()
+            on_done(result)
+
+        def error(e):
+            self._refresh_finished()
+            if on_error is not None:
+                on_error(e)
+
+        self.submit(fn, on_done=done, on_error=error)
+
+    def _refresh_finished(self):
+        self._refresh_running = False
+        if self._refresh_pending:
+            self._refresh_pending = False
+            self.submit_refresh(*self._refresh_args)
+
+    def wait_for_done(self, msecs: int = -1) -> bool:
+        return self.pool.waitForDone(msecs) and self.background.waitForDone(msecs)
+
+    def is_busy(self) -> bool:
+        return bool(self._callbacks)
+
+    @pyqtSlot(int, object)
+    def _on_finished(self, job_id, result):
+        on_done, _ = self._callbacks.pop(job_id)
+        if on_done is not None:
+            self._timed(on_done, result)
+
+    @pyqtSlot(int, object)
+    def _on_failed(self, job_id, error):
+        _, on_error = self._callbacks.pop(job_id)
+        if on_error is not None:
+            self._timed(on_error, error)
+
+    def _timed(self, callback, arg):
+        start = time.perf_counter()
+        try:
+            callback(arg)
+        finally:
+            self.last_block_ms = (time.perf_counter() - start) * 1000
+            self.max_block_ms = max(self.max_block_ms, self.last_block_ms)
+            if self.last_block_ms > self.budget_ms:
+                self.over_budget += 1
+                metrics.incr('gui.over_budget')
+                logger.debug("GUI thread blocked for %.1fms by %s (budget %sms)", self.last_block_ms,
+                             getattr(callback, '__qualname__', callback), self.budget_ms)